@@ -1,11 +1,18 @@
+import bisect
+import functools
+import inspect
+import itertools
 import json
 import logging
-from datetime import datetime, timedelta
-from typing import Any, Callable, Dict, List, Literal
+import operator
+import re
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Literal, Optional
 
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 from tabulate import tabulate
 
 from sqids import Sqids
@@ -26,6 +33,45 @@ DEFAULT_CONFIG = {
 TRANSACTION_EXPIRATION_DELAY = 86400 * 14 # 14 days
 TRANSACTION_CLEANUP_INTERVAL = 3600 # 1 hour
 
+MEMBERS_CACHE_TTL = 5 # secondes
+LEADERBOARD_CACHE_TTL = 30 # secondes
+AUTOCOMPLETE_CACHE_TTL = 5 # secondes
+
+# Forme d'un symbole de monnaie : 1 à 3 caractères (espaces simples tolérés), pas uniquement des espaces ; l'imprimabilité est vérifiée par str.isprintable()
+_CURRENCY_RE = re.compile(r'(?! *$)(?:\S| ){1,3}')
+
+_SQIDS = Sqids() # Encodeur partagé des identifiants de transaction
+
+# Réglages SQLite appliqués à l'ouverture de chaque connexion aux bases de données des serveurs
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA foreign_keys=ON"
+)
+# Nombre maximal de comptes traités par requête groupée (3 paramètres par compte, sous la limite historique de 999 variables)
+SQLITE_BATCH_SIZE = 250
+
+# UTILS =======================================================================
+
+def require_guild(func: Callable) -> Callable:
+    """Décorateur de commande vérifiant qu'elle est utilisée sur un serveur et transmettant ce dernier en argument après l'interaction"""
+    @functools.wraps(func)
+    async def wrapper(self, interaction: discord.Interaction, *args, **kwargs):
+        guild = interaction.guild
+        if not isinstance(guild, discord.Guild):
+            return await interaction.response.send_message('**Membre inconnu** · Vous devez être présent sur le serveur', ephemeral=True)
+        return await func(self, interaction, guild, *args, **kwargs)
+    
+    # discord.py déduit les options de la commande de sa signature : on en retire le serveur injecté
+    signature = inspect.signature(func)
+    params = list(signature.parameters.values())
+    del params[2]
+    wrapper.__signature__ = signature.replace(parameters=params) # type: ignore
+    return wrapper
+
 # UI ==========================================================================
 
 class TransactionsHistoryView(discord.ui.View):
@@ -37,7 +83,11 @@ class TransactionsHistoryView(discord.ui.View):
         self.transactions : List['Transaction'] = account.get_transactions()
         self.current_page = 0
         self.display_type = 'reason'
-        self.pages : List[discord.Embed] = self.get_pages(self.display_type)
+        self._pages_by_display : Dict[str, List[discord.Embed]] = {
+            'reason': self.get_pages('reason'),
+            'ids': self.get_pages('ids')
+        }
+        self.pages : List[discord.Embed] = self._pages_by_display[self.display_type]
         
         self.previous.disabled = True
         if len(self.pages) <= 1:
@@ -53,25 +103,18 @@ class TransactionsHistoryView(discord.ui.View):
         
     def get_pages(self, display: Literal['reason', 'ids']):
         embeds = []
-        tabl = []
         coltype = "Raison" if display == 'reason' else "Identifiant"
-        for trs in self.transactions:
-            if len(tabl) < 20:
-                if display == 'reason':
-                    tabl.append((f"{trs.frelative}", f"{trs.amount:+}", f"{pretty.troncate_text(trs.reason, 50)}"))
-                else:
-                    tabl.append((f"{trs.frelative}", f"{trs.amount:+}", f"{trs.id}"))
-            else:
-                em = discord.Embed(color=0x2b2d31, description=pretty.codeblock(tabulate(tabl, headers=("Date", "Montant", coltype))))
-                em.set_author(name=f"Historique des transactions · {self.account.owner.display_name}", icon_url=self.account.owner.display_avatar.url)
-                em.set_footer(text=f"{len(self.transactions)} transactions sur les {int(TRANSACTION_EXPIRATION_DELAY / 86400)} derniers jours")
-                embeds.append(em)
-                tabl = []
-        
-        if tabl:
-            em = discord.Embed(color=0x2b2d31, description=pretty.codeblock(tabulate(tabl, headers=("Date", "Montant", coltype)))) 
-            em.set_author(name=f"Historique des transactions · {self.account.owner.display_name}", icon_url=self.account.owner.display_avatar.url)
-            em.set_footer(text=f"{len(self.transactions)} transactions sur les {int(TRANSACTION_EXPIRATION_DELAY / 86400)} derniers jours")
+        author_name = f"Historique des transactions · {self.account.owner.display_name}"
+        author_icon = self.account.owner.display_avatar.url
+        footer = f"{len(self.transactions)} transactions sur les {int(TRANSACTION_EXPIRATION_DELAY / 86400)} derniers jours"
+        
+        today = datetime.now().date()
+        headers = ("Date", "Montant", coltype)
+        rows = [(trs.format_relative(today), format(trs.amount, '+'), pretty.troncate_text(trs.reason, 50) if display == 'reason' else trs.id) for trs in self.transactions]
+        for chunk in (rows[i:i + 20] for i in range(0, len(rows), 20)):
+            em = discord.Embed(color=0x2b2d31, description=pretty.codeblock(tabulate(chunk, headers=headers)))
+            em.set_author(name=author_name, icon_url=author_icon)
+            em.set_footer(text=footer)
             embeds.append(em)
             
         return embeds
@@ -101,7 +144,7 @@ class TransactionsHistoryView(discord.ui.View):
     @discord.ui.button(label="Aff. IDs", style=discord.ButtonStyle.gray)
     async def switch_display(self, interaction: discord.Interaction, button: discord.ui.Button):
         self.display_type = 'reason' if self.display_type == 'ids' else 'ids'
-        self.pages = self.get_pages(self.display_type)
+        self.pages = self._pages_by_display[self.display_type]
         await self.buttons_logic(interaction)
         await interaction.response.edit_message(embed=self.pages[self.current_page])
 
@@ -142,12 +185,13 @@ class ConfirmationView(discord.ui.View):
 
 class Account:
     """Représente le compte bancaire d'un utilisateur sur un serveur"""
-    def __init__(self, cog: 'Economy', user: discord.Member):
+    def __init__(self, cog: 'Economy', user: discord.Member, *, _skip_create: bool = False):
         self.__cog = cog
         self.owner = user
         self.guild = user.guild
         
-        self.__create_if_not_exists()
+        if not _skip_create: # Inutile pour les comptes lus depuis la table des comptes
+            self.__create_if_not_exists()
         
     def __repr__(self):
         return f"<Account user={self.owner}>"
@@ -170,7 +214,9 @@ class Account:
         return hash(self.owner)
         
     def __create_if_not_exists(self):
-        self.__cog.data.execute(self.guild, "INSERT OR IGNORE INTO accounts VALUES (?, ?)", (self.owner.id, int(self.__cog.get_guild_config(self.guild)['DefaultBalance'])))
+        default_balance = int(self.__cog.get_guild_config(self.guild)['DefaultBalance'])
+        if self.__cog.data.execute(self.guild, "INSERT OR IGNORE INTO accounts VALUES (?, ?)", (self.owner.id, default_balance)):
+            self.__cog._apply_balance_change(self.guild, None, default_balance)
         
     def _get_balance(self) -> int:
         return self.__cog.data.fetchone(self.guild, "SELECT balance FROM accounts WHERE user_id = ?", (self.owner.id,))['balance']
@@ -178,8 +224,12 @@ class Account:
     def _set_balance(self, value: int, *, reason: str = '') -> 'Transaction':
         current = self._get_balance()
         delta = value - current
-        self.__cog.data.execute(self.guild, "UPDATE accounts SET balance = ? WHERE user_id = ?", (value, self.owner.id))
-        return Transaction(self.__cog, self.owner, delta, reason=reason)
+        # La mise à jour du solde et l'enregistrement de la transaction partagent le même commit
+        with self.__cog.data.transaction(self.guild):
+            self.__cog.data.execute(self.guild, "UPDATE accounts SET balance = ? WHERE user_id = ?", (value, self.owner.id))
+            trs = Transaction(self.__cog, self.owner, delta, reason=reason)
+        self.__cog._apply_balance_change(self.guild, current, value)
+        return trs
     
     @property
     def balance(self) -> int:
@@ -207,7 +257,7 @@ class Account:
     def withdraw(self, amount: int, *, reason: str = '') -> 'Transaction':
         """Retire de l'argent du compte"""
         if amount < 0:
-            amount = abs(amount)
+            raise ValueError('Le montant à retirer ne peut pas être négatif')
             
         return self._set_balance(self._get_balance() - amount, reason=reason)
     
@@ -227,13 +277,11 @@ class Account:
     
     def get_transactions(self, limit: int | None = 5) -> List['Transaction']:
         """Renvoie les dernières transactions du compte"""
-        if limit:
-            rows = self.__cog.data.fetchall(self.guild, "SELECT * FROM transactions WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?", (self.owner.id, limit))
-        else:
-            rows = self.__cog.data.fetchall(self.guild, "SELECT * FROM transactions WHERE user_id = ? ORDER BY timestamp DESC", (self.owner.id,))
-        return [Transaction(self.__cog, self.owner, row['amount'], reason=row['reason'], timestamp=row['timestamp']) for row in rows]
+        # Une limite négative équivaut à aucune limite, ce qui permet de réutiliser la même requête préparée
+        rows = self.__cog.data.fetchall(self.guild, "SELECT * FROM transactions WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?", (self.owner.id, limit or -1))
+        return [Transaction(self.__cog, self.owner, row['amount'], reason=row['reason'], timestamp=row['timestamp'], _skip_persist=True) for row in rows]
     
-    def get_transaction(self, id: str) -> 'Transaction':
+    def get_transaction(self, id: str) -> Optional['Transaction']:
         """Renvoie une transaction du compte"""
         return Transaction.from_id(self.__cog, self.guild, id)
     
@@ -246,21 +294,27 @@ class Account:
     
     # Utils --------------------------------------------------------------------
     
+    def _embed_data(self) -> tuple[int, int, int, List['Transaction']]:
+        """Renvoie le solde, la variation sur 24h, le rang et les dernières transactions du compte"""
+        since = (datetime.now() - timedelta(hours=24)).timestamp()
+        query = """SELECT a.balance AS balance,
+            (SELECT COALESCE(SUM(t.amount), 0) FROM transactions t WHERE t.user_id = a.user_id AND t.timestamp > ?) AS variation
+            FROM accounts a WHERE a.user_id = ?"""
+        r = self.__cog.data.fetchone(self.guild, query, (since, self.owner.id))
+        # Le rang est calculé parmi les membres présents, comme dans le classement
+        return r['balance'], r['variation'], self.__cog.get_balance_rank(self.guild, r['balance']), self.get_transactions()
+    
     @property
     def embed(self) -> discord.Embed:
         """Retourne une embed d'information sur le compte"""
+        balance, balancevar, rank, transactions = self._embed_data()
         em = discord.Embed(title=f"Compte Bancaire · *{self.owner.display_name}*", color=0x2b2d31)
-        em.add_field(name="Solde", value=pretty.codeblock(self.display_balance))
-
-        balancevar = self.balance_variation(datetime.now() - timedelta(hours=24))
+        em.add_field(name="Solde", value=pretty.codeblock(f'{balance}{self.__cog.get_currency(self.guild)}'))
         em.add_field(name="Var. s/ 24h", value=pretty.codeblock(f'{balancevar:+}', lang='diff'))
-        
-        rank = self.__cog.get_account_rank(self)
         em.add_field(name="Rang", value=pretty.codeblock(f'#{rank}'))
         
-        transactions = self.get_transactions()
         if transactions:
-            txt = '\n'.join([str(tr) for tr in transactions])
+            txt = '\n'.join(str(tr) for tr in transactions)
             em.add_field(name="Dernières transactions", value=pretty.codeblock(txt, lang='diff'), inline=False)
     
         em.set_thumbnail(url=self.owner.display_avatar.url)
@@ -268,20 +322,21 @@ class Account:
     
 class Transaction:
     """Represente une transaction économique"""
-    def __init__(self, cog: 'Economy', user: discord.Member, amount: int, *, reason: str = '', timestamp: float = 0):
+    def __init__(self, cog: 'Economy', user: discord.Member, amount: int, *, reason: str = '', timestamp: float = 0, _skip_persist: bool = False):
         self.__cog = cog
         self.user = user
         self.guild = user.guild
         self.amount = amount
         self.reason = reason or 'Non précisée'
         self.timestamp = timestamp or datetime.now().timestamp()
+        self._currency = cog.get_currency(self.guild)
         
         self.id = self.__get_id()
-        self.__create_if_not_exists()
+        if not _skip_persist: # Inutile pour les transactions chargées depuis la base de données
+            self.__create_if_not_exists()
 
     def __get_id(self) -> str:
-        s = Sqids()
-        return s.encode([int(self.timestamp), self.user.id, abs(self.amount)])
+        return _SQIDS.encode([int(self.timestamp), self.user.id, abs(self.amount)])
     
     def __repr__(self):
         return f"<Transaction id={self.id}>"
@@ -302,19 +357,18 @@ class Transaction:
     
     def __create_if_not_exists(self):
         self.__cog.data.execute(self.guild, "INSERT OR IGNORE INTO transactions VALUES (?, ?, ?, ?, ?)", (self.id, self.timestamp, self.amount, self.reason, self.user.id))
-        
-        if self.__cog.last_cleanup + TRANSACTION_CLEANUP_INTERVAL < datetime.now().timestamp():
-            self.__cog.cleanup_transactions(self.guild)
-            self.__cog.last_cleanup = datetime.now().timestamp()
                 
     @classmethod
-    def from_id(cls, cog: 'Economy', guild: discord.Guild, id: str):
-        row = cog.data.fetchone(guild, "SELECT * FROM transactions WHERE id = ?", (id,))
+    def from_id(cls, cog: 'Economy', guild: discord.Guild, id: str) -> Optional['Transaction']:
+        # Recherche ponctuelle sur la clé primaire
+        row = cog.data.fetchone(guild, "SELECT user_id, amount, reason, timestamp FROM transactions WHERE id = ? LIMIT 1", (id,))
+        if not row:
+            return None
         user = guild.get_member(row['user_id'])
         if not user:
             raise ValueError('L\'utilisateur n\'est pas présent sur le serveur')
         
-        return cls(cog, user, row['amount'], reason=row['reason'], timestamp=row['timestamp'])
+        return cls(cog, user, row['amount'], reason=row['reason'], timestamp=row['timestamp'], _skip_persist=True)
     
     # Functions ----------------------------------------------------------------
     
@@ -341,13 +395,18 @@ class Transaction:
     @property
     def frelative(self) -> str:
         """Renvoie la date de la transaction dans un format court et de manière relative"""
-        today = datetime.now().date()
-        if datetime.fromtimestamp(self.timestamp).date() == today:
-            return f"{self.ftime}"
-        elif datetime.fromtimestamp(self.timestamp).year == today.year:
-            return datetime.fromtimestamp(self.timestamp).strftime('%d/%m')
+        return self.format_relative()
+    
+    def format_relative(self, today: date | None = None) -> str:
+        """Renvoie la date de la transaction dans un format court et relatif à la date donnée (aujourd'hui par défaut)"""
+        today = today or datetime.now().date()
+        dt = datetime.fromtimestamp(self.timestamp)
+        if dt.date() == today:
+            return dt.strftime('%H:%M')
+        elif dt.year == today.year:
+            return dt.strftime('%d/%m')
         else:
-            return f'{self.fdate} {self.ftime}'
+            return dt.strftime('%d/%m/%Y %H:%M')
     
     @property
     def fdiscord(self) -> str:
@@ -359,7 +418,7 @@ class Transaction:
     @property
     def display_amount(self) -> str:
         """Retourne une représentation textuelle du montant de la transaction avec le symbole de la monnaie du serveur"""
-        return f'{self.amount}{self.__cog.get_currency(self.guild)}'
+        return f'{self.amount}{self._currency}'
     
     @property
     def embed(self) -> discord.Embed:
@@ -431,7 +490,7 @@ class Economy(commands.Cog):
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.data = dataio.get_cog_data(self)
+        self.data = dataio.get_cog_data(self, pragmas=SQLITE_PRAGMAS)
         
         ctx_account_menu = app_commands.ContextMenu(
             name='Compte bancaire',
@@ -439,7 +498,17 @@ class Economy(commands.Cog):
         )
         self.bot.tree.add_command(ctx_account_menu)
         
-        self.last_cleanup : float = 0
+        # Caches de la configuration des serveurs
+        self._config_cache : Dict[int, Dict[str, str]] = {}
+        self._currency_cache : Dict[int, str] = {}
+        # Cache de courte durée des membres des serveurs indexés par ID
+        self._members_cache : Dict[int, tuple[float, Dict[int, discord.Member]]] = {}
+        # Cache de courte durée des comptes triés par solde (invalidé à chaque modification de solde)
+        self._lb_cache : Dict[int, tuple[float, List[Account]]] = {}
+        # Agrégats des soldes maintenus incrémentalement (total, nombre de comptes et soldes triés)
+        self._guild_aggregates : Dict[int, Dict[str, Any]] = {}
+        # Cache des dernières transactions proposées en autocomplétion
+        self._autocomplete_cache : Dict[int, tuple[float, Dict[str, Transaction]]] = {}
         
     def _init_guilds_db(self, guild: discord.Guild | None = None):
         guilds = [guild] if guild else self.bot.guilds
@@ -463,43 +532,123 @@ class Economy(commands.Cog):
             id TEXT PRIMARY KEY,
             value TEXT
             )"""
+        daily = """CREATE TABLE IF NOT EXISTS daily (
+            user_id INTEGER PRIMARY KEY,
+            last_daily INTEGER
+            )"""
+        indexes = (
+            "DROP INDEX IF EXISTS idx_tx_user_ts", # Remplacé par idx_tx_cover
+            "CREATE INDEX IF NOT EXISTS idx_tx_cover ON transactions (user_id, timestamp DESC, amount)",
+            "CREATE INDEX IF NOT EXISTS idx_tx_ts ON transactions (timestamp)",
+            "CREATE INDEX IF NOT EXISTS idx_accounts_balance ON accounts (balance DESC)"
+        )
         for g in guilds:
             self.data.execute(g, accounts, commit=False)
             self.data.execute(g, transactions, commit=False)
             self.data.execute(g, config, commit=False)
             self.data.execute(g, conditions, commit=False)
+            self.data.execute(g, daily, commit=False)
+            self.data.execute(g, "DROP TABLE IF EXISTS guild_stats", commit=False) # Anciens agrégats sauvegardés, désormais calculés au premier usage
+            for index in indexes:
+                self.data.execute(g, index, commit=False)
+            self._migrate_last_daily(g)
             self.data.commit(g)
             
             self.data.executemany(g, """INSERT OR IGNORE INTO config (key, value) VALUES (?, ?)""", DEFAULT_CONFIG.items())
         
+    def _migrate_last_daily(self, guild: discord.Guild) -> None:
+        """Reporte les anciennes conditions LastDaily (date au format JJ.MM.AAAA) dans la table daily puis les supprime"""
+        rows = self.data.fetchall(guild, "SELECT id, value FROM conditions WHERE id LIKE 'LastDaily@%'")
+        if not rows:
+            return
+        days = []
+        for row in rows:
+            try:
+                day = datetime.strptime(json.loads(row['value']), '%d.%m.%Y').date().toordinal()
+            except (TypeError, ValueError):
+                continue # Valeur vide ou invalide : aucune aide perçue
+            days.append((int(row['id'].partition('@')[2]), day))
+        # Une date déjà présente dans daily est plus récente que la condition
+        self.data.executemany(guild, "INSERT OR IGNORE INTO daily VALUES (?, ?)", days, commit=False)
+        self.data.execute(guild, "DELETE FROM conditions WHERE id LIKE 'LastDaily@%'", commit=False)
+        
     @commands.Cog.listener()
     async def on_ready(self):
         self._init_guilds_db()
+        if not self._cleanup_loop.is_running():
+            self._cleanup_loop.start()
         
     @commands.Cog.listener()
     async def on_guild_join(self, guild: discord.Guild):
         self._init_guilds_db(guild)
+        
+    # Les statistiques ne portent que sur les membres présents : on y ajoute ou retire le compte des membres qui arrivent ou partent
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        if member.guild.id in self._guild_aggregates:
+            r = self.data.fetchone(member.guild, "SELECT balance FROM accounts WHERE user_id = ?", (member.id,))
+            if r:
+                self._apply_balance_change(member.guild, None, r['balance'])
+                
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        if member.guild.id in self._guild_aggregates:
+            r = self.data.fetchone(member.guild, "SELECT balance FROM accounts WHERE user_id = ?", (member.id,))
+            if r:
+                self._apply_balance_change(member.guild, r['balance'], None)
     
     def cog_unload(self):
+        self._cleanup_loop.cancel()
         self.data.close_all_databases()
             
     # Settings -----------------------------------------------------------------
     
     def get_guild_config(self, guild: discord.Guild) -> Dict[str, str]:
         """Renvoie la valeur d'un paramètre de configuration ou tous les paramètres de configuration"""
+        if guild.id in self._config_cache:
+            return self._config_cache[guild.id]
+        
         r = self.data.fetchall(guild, "SELECT * FROM config")
         if r:
-            return {row['key']: row['value'] for row in r}
+            config = {row['key']: row['value'] for row in r}
+            self._config_cache[guild.id] = config
+            return config
         else:
             return DEFAULT_CONFIG
     
     def set_guild_config(self, guild: discord.Guild, key: str, value: Any) -> None:
         """Modifie la valeur d'un paramètre de configuration"""
         self.data.execute(guild, "INSERT OR REPLACE INTO config VALUES (?, ?)", (key, value))
+        self._config_cache.pop(guild.id, None)
+        self._currency_cache.pop(guild.id, None)
     
     def get_currency(self, guild: discord.Guild) -> str:
         """Renvoie le symbole de la monnaie"""
-        return str(self.get_guild_config(guild)['Currency'])
+        if guild.id not in self._currency_cache:
+            self._currency_cache[guild.id] = str(self.get_guild_config(guild)['Currency'])
+        return self._currency_cache[guild.id]
+    
+    # Daily --------------------------------------------------------------------
+    
+    def get_last_daily(self, user: discord.Member) -> int:
+        """Renvoie le jour (ordinal) de la dernière aide quotidienne perçue par un membre, 0 s'il n'en a jamais perçu"""
+        r = self.data.fetchone(user.guild, "SELECT last_daily FROM daily WHERE user_id = ?", (user.id,))
+        return r['last_daily'] if r else 0
+    
+    def set_last_daily(self, user: discord.Member, day: int) -> None:
+        """Modifie le jour (ordinal) de la dernière aide quotidienne perçue par un membre"""
+        self.data.execute(user.guild, "INSERT OR REPLACE INTO daily VALUES (?, ?)", (user.id, day))
+    
+    # Members ------------------------------------------------------------------
+    
+    def _members_by_id(self, guild: discord.Guild) -> Dict[int, discord.Member]:
+        """Renvoie les membres du serveur indexés par ID (mis en cache quelques secondes)"""
+        cached = self._members_cache.get(guild.id)
+        if cached and time.monotonic() - cached[0] < MEMBERS_CACHE_TTL:
+            return cached[1]
+        members = {m.id: m for m in guild.members}
+        self._members_cache[guild.id] = (time.monotonic(), members)
+        return members
     
     # Accounts -----------------------------------------------------------------
     
@@ -510,66 +659,188 @@ class Economy(commands.Cog):
     def get_accounts(self, guild: discord.Guild) -> List[Account]:
         """Renvoie les comptes de tous les utilisateurs"""
         members = guild.members
-        r = self.data.fetchall(guild, "SELECT * FROM accounts")
-        return [Account(self, m) for m in members if m.id in [row['user_id'] for row in r]]
+        r = self.data.fetchall(guild, "SELECT user_id FROM accounts")
+        ids = {row['user_id'] for row in r}
+        return [Account(self, m, _skip_create=True) for m in members if m.id in ids]
+    
+    def _fetch_all_balances(self, guild: discord.Guild) -> Dict[int, int]:
+        """Renvoie les soldes de tous les comptes du serveur en une seule requête, triés par solde décroissant"""
+        r = self.data.fetchall(guild, "SELECT user_id, balance FROM accounts ORDER BY balance DESC")
+        return {row['user_id']: row['balance'] for row in r}
+    
+    def deposit_many(self, guild: discord.Guild, deposits: List[tuple[discord.Member, int, str]]) -> List[Transaction]:
+        """Ajoute de l'argent à plusieurs comptes en regroupant les mises à jour des soldes en une seule requête"""
+        deltas : Dict[int, int] = {}
+        for member, amount, _ in deposits:
+            deltas[member.id] = deltas.get(member.id, 0) + amount
+        if not deltas:
+            return []
+        
+        ids = list(deltas)
+        default_balance = int(self.get_guild_config(guild)['DefaultBalance'])
+        with self.data.transaction(guild):
+            current : Dict[int, int] = {}
+            for i in range(0, len(ids), SQLITE_BATCH_SIZE):
+                chunk = ids[i:i + SQLITE_BATCH_SIZE]
+                rows = self.data.fetchall(guild, f"SELECT user_id, balance FROM accounts WHERE user_id IN ({','.join('?' * len(chunk))})", chunk)
+                current.update((row['user_id'], row['balance']) for row in rows)
+            created = [user_id for user_id in ids if user_id not in current]
+            if created:
+                self.data.executemany(guild, "INSERT INTO accounts VALUES (?, ?)", ((user_id, default_balance) for user_id in created))
+                current.update(dict.fromkeys(created, default_balance))
+            
+            for i in range(0, len(ids), SQLITE_BATCH_SIZE):
+                chunk = ids[i:i + SQLITE_BATCH_SIZE]
+                cases = ' '.join(['WHEN ? THEN ?'] * len(chunk))
+                params = [v for user_id in chunk for v in (user_id, deltas[user_id])] + chunk
+                self.data.execute(guild, f"UPDATE accounts SET balance = balance + CASE user_id {cases} END WHERE user_id IN ({','.join('?' * len(chunk))})", params)
+            
+            transactions = [Transaction(self, member, amount, reason=reason, _skip_persist=True) for member, amount, reason in deposits]
+            self.data.executemany(guild, "INSERT OR IGNORE INTO transactions VALUES (?, ?, ?, ?, ?)", ((t.id, t.timestamp, t.amount, t.reason, t.user.id) for t in transactions))
+        
+        for user_id in created:
+            self._apply_balance_change(guild, None, default_balance)
+        for user_id, delta in deltas.items():
+            self._apply_balance_change(guild, current[user_id], current[user_id] + delta)
+        return transactions
     
     # Stats & Utils --------------------------------------------------------------------
     
+    @staticmethod
+    def _median(balances: List[int]) -> int:
+        """Renvoie la médiane d'une liste de soldes triée par ordre croissant"""
+        # Même élément que l'indice len // 2 d'une liste triée par solde décroissant
+        return balances[len(balances) - 1 - len(balances) // 2] if balances else 0
+    
+    def _compute_guild_aggregates(self, guild: discord.Guild) -> Dict[str, Any]:
+        """Calcule les agrégats des soldes du serveur à partir des comptes des membres présents"""
+        balances = sorted(b for user_id, b in self._fetch_all_balances(guild).items() if guild.get_member(user_id))
+        return {
+            'total': sum(balances),
+            'count': len(balances),
+            'balances': balances
+        }
+    
+    def _get_guild_aggregates(self, guild: discord.Guild) -> Dict[str, Any]:
+        """Renvoie les agrégats des soldes du serveur, calculés depuis les comptes au premier appel puis tenus à jour en mémoire"""
+        if guild.id not in self._guild_aggregates:
+            self._guild_aggregates[guild.id] = self._compute_guild_aggregates(guild)
+        return self._guild_aggregates[guild.id]
+    
+    def _get_guild_balances(self, guild: discord.Guild) -> List[int]:
+        """Renvoie les soldes du serveur triés par ordre croissant"""
+        return self._get_guild_aggregates(guild)['balances']
+    
+    def _apply_balance_change(self, guild: discord.Guild, old: int | None, new: int | None) -> None:
+        """Répercute la modification d'un solde sur les caches, une fois la transaction en cours validée (old à None : compte ajouté, new à None : compte retiré)"""
+        # Si la transaction est annulée, les caches ne sont pas modifiés et restent conformes à la base
+        self.data.call_after_commit(guild, functools.partial(self._update_balance_caches, guild, old, new))
+        
+    def _update_balance_caches(self, guild: discord.Guild, old: int | None, new: int | None) -> None:
+        self._lb_cache.pop(guild.id, None)
+        aggregates = self._guild_aggregates.get(guild.id)
+        if not aggregates:
+            return # Le solde est déjà enregistré : les agrégats chargés plus tard en tiendront compte
+        balances = aggregates['balances']
+        if old is not None:
+            i = bisect.bisect_left(balances, old)
+            if i == len(balances) or balances[i] != old:
+                # Solde absent des agrégats (membre parti entre-temps) : ils seront recalculés au prochain usage
+                del self._guild_aggregates[guild.id]
+                return
+            del balances[i]
+            aggregates['count'] -= 1
+            aggregates['total'] -= old
+        if new is not None:
+            aggregates['count'] += 1
+            aggregates['total'] += new
+            bisect.insort(balances, new)
+    
     #guild
     def get_guild_average_balance(self, guild: discord.Guild) -> int:
         """Renvoie la moyenne des soldes des comptes"""
-        accounts = self.get_accounts(guild)
-        return sum([a.balance for a in accounts]) // len(accounts)
+        aggregates = self._get_guild_aggregates(guild)
+        return aggregates['total'] // aggregates['count'] if aggregates['count'] else 0
     
     def get_guild_total_balance(self, guild: discord.Guild) -> int:
         """Renvoie la somme des soldes des comptes"""
-        accounts = self.get_accounts(guild)
-        return sum([a.balance for a in accounts])
+        return self._get_guild_aggregates(guild)['total']
     
     def get_guild_median_balance(self, guild: discord.Guild) -> int:
         """Renvoie la médiane des soldes des comptes"""
-        accounts = self.get_accounts_by_balance(guild)
-        return accounts[len(accounts) // 2].balance
+        return self._median(self._get_guild_balances(guild))
     
     # accounts
     def get_accounts_by_balance(self, guild: discord.Guild, *, reverse: bool = True) -> List[Account]:
         """Renvoie les comptes de tous les utilisateurs triés par solde"""
-        accounts = self.get_accounts(guild)
-        return sorted(accounts, key=lambda a: a.balance, reverse=reverse)
+        cached = self._lb_cache.get(guild.id)
+        if cached and time.monotonic() - cached[0] < LEADERBOARD_CACHE_TTL:
+            accounts = cached[1]
+        else:
+            balances = self._fetch_all_balances(guild)
+            members = (guild.get_member(user_id) for user_id in balances)
+            accounts = [Account(self, m, _skip_create=True) for m in members if m]
+            self._lb_cache[guild.id] = (time.monotonic(), accounts)
+        return accounts[:] if reverse else accounts[::-1]
+    
+    def get_top_accounts(self, guild: discord.Guild, n: int = 20) -> List[Account]:
+        """Renvoie les N comptes les plus riches du serveur"""
+        cached = self._lb_cache.get(guild.id)
+        if cached and time.monotonic() - cached[0] < LEADERBOARD_CACHE_TTL:
+            return cached[1][:n]
+        # Les soldes sont déjà triés par SQLite : on s'arrête dès que N membres présents ont été trouvés
+        balances = self._fetch_all_balances(guild)
+        members = filter(None, (guild.get_member(user_id) for user_id in balances))
+        return [Account(self, m, _skip_create=True) for m in itertools.islice(members, n)]
     
     def get_account_rank(self, account: Account) -> int:
         """Renvoie le rang d'un compte"""
-        accounts = self.get_accounts_by_balance(account.guild)
-        return accounts.index(account) + 1
+        return self.get_balance_rank(account.guild, account.balance)
+    
+    def get_balance_rank(self, guild: discord.Guild, balance: int) -> int:
+        """Renvoie le rang d'un solde parmi les comptes des membres présents"""
+        balances = self._get_guild_balances(guild)
+        return len(balances) - bisect.bisect_right(balances, balance) + 1
     
     # transactions
     def get_last_transactions(self, guild: discord.Guild, *, limit: int | None = 10) -> List[Transaction]:
         """Renvoie les dernières transactions de tous les utilisateurs"""
-        if limit:
-            rows = self.data.fetchall(guild, "SELECT * FROM transactions ORDER BY timestamp DESC LIMIT ?", (limit,))
-        else:
-            rows = self.data.fetchall(guild, "SELECT * FROM transactions ORDER BY timestamp DESC")
-        members = {m.id: m for m in guild.members}
-        return [Transaction(self, members[row['user_id']], row['amount'], reason=row['reason'], timestamp=row['timestamp']) for row in rows if row['user_id'] in members]
+        rows = self.data.fetchall(guild, "SELECT * FROM transactions ORDER BY timestamp DESC LIMIT ?", (limit or -1,))
+        members = self._members_by_id(guild)
+        return [Transaction(self, members[row['user_id']], row['amount'], reason=row['reason'], timestamp=row['timestamp'], _skip_persist=True) for row in rows if row['user_id'] in members]
     
     def get_transactions_by_amount(self, guild: discord.Guild, *, reverse: bool = True) -> List[Transaction]:
         """Renvoie les transactions de tous les utilisateurs triées par montant"""
         transactions = self.get_last_transactions(guild, limit=None)
-        return sorted(transactions, key=lambda t: t.amount, reverse=reverse)
+        return sorted(transactions, key=operator.attrgetter('amount'), reverse=reverse)
     
     def get_transactions_since(self, guild: discord.Guild, since: datetime | float) -> List[Transaction]:
         """Renvoie les transactions de tous les utilisateurs depuis une date"""
         if isinstance(since, datetime):
             since = since.timestamp()
         rows = self.data.fetchall(guild, "SELECT * FROM transactions WHERE timestamp > ? ORDER BY timestamp DESC", (since,))
-        members = {m.id: m for m in guild.members}
-        return [Transaction(self, members[row['user_id']], row['amount'], reason=row['reason'], timestamp=row['timestamp']) for row in rows if row['user_id'] in members]
+        members = self._members_by_id(guild)
+        return [Transaction(self, members[row['user_id']], row['amount'], reason=row['reason'], timestamp=row['timestamp'], _skip_persist=True) for row in rows if row['user_id'] in members]
+    
+    def get_transactions_sum_since(self, guild: discord.Guild, since: datetime | float) -> int:
+        """Renvoie la somme des montants des transactions de tous les utilisateurs depuis une date"""
+        if isinstance(since, datetime):
+            since = since.timestamp()
+        r = self.data.fetchone(guild, "SELECT COALESCE(SUM(amount), 0) AS total FROM transactions WHERE timestamp > ?", (since,))
+        return int(r['total'])
     
     # Data Management ----------------------------------------------------------
     
-    def cleanup_transactions(self, guild: discord.Guild) -> None:
+    def cleanup_transactions(self, guild: discord.Guild, now: datetime | None = None) -> None:
         """Supprime les transactions expirées"""
-        self.data.execute(guild, "DELETE FROM transactions WHERE timestamp < ?", (datetime.now().timestamp() - TRANSACTION_EXPIRATION_DELAY,))
+        now = now or datetime.now()
+        self.data.execute(guild, "DELETE FROM transactions WHERE timestamp < ?", (now.timestamp() - TRANSACTION_EXPIRATION_DELAY,))
+        
+    @tasks.loop(seconds=TRANSACTION_CLEANUP_INTERVAL)
+    async def _cleanup_loop(self):
+        now = datetime.now()
+        for guild in self.bot.guilds:
+            self.cleanup_transactions(guild, now)
     
     # COMMANDES =================================================================
     
@@ -638,8 +909,9 @@ class Economy(commands.Cog):
         if giver.balance < amount:
             return await interaction.response.send_message('**Solde insuffisant** · Vous n\'avez pas assez d\'argent', ephemeral=True)
         
-        giver.withdraw(amount, reason=f'Don à {user.display_name} > {reason}' if reason else f'Don à {user.display_name}')
-        trs = receiver.deposit(amount, reason=f'Don de {interaction.user.display_name} > {reason}' if reason else f'Don de {interaction.user.display_name}')
+        with self.data.transaction(user.guild):
+            giver.withdraw(amount, reason=f'Don à {user.display_name} > {reason}' if reason else f'Don à {user.display_name}')
+            trs = receiver.deposit(amount, reason=f'Don de {interaction.user.display_name} > {reason}' if reason else f'Don de {interaction.user.display_name}')
 
         await interaction.response.send_message(f'**Transfert effectué** · **{trs.display_amount}** ont été envoyés à {user.mention} : `{reason}`' if reason else f'**Transfert effectué** · **{trs.display_amount}** ont été envoyés à {user.mention}')
     
@@ -653,80 +925,76 @@ class Economy(commands.Cog):
         if not isinstance(user, discord.Member):
             return await interaction.response.send_message('**Membre inconnu** · Vous devez être présent sur le serveur', ephemeral=True)
         
-        account = self.get_account(user)
-        today = datetime.now().strftime('%d.%m.%Y')
-        config = self.get_guild_config(user.guild)
+        # Rejet rapide du cas le plus fréquent : l'aide a déjà été perçue aujourd'hui
+        today = date.today().toordinal()
+        if self.get_last_daily(user) == today:
+            return await interaction.response.send_message("**Déjà perçue** · Vous avez déjà récupéré votre aide quotidienne aujourd'hui, réessayez demain.", ephemeral=True)
         
+        config = self.get_guild_config(user.guild)
         dailyamount = int(config['DailyAmount'])
         dailylimit = int(config['DailyLimit'])
-        premiumamount = int(config['PremiumDailyAmount'])
-        
         is_premium = user.premium_since is not None
         if is_premium:
-            dailyamount += premiumamount
+            dailyamount += int(config['PremiumDailyAmount'])
         
         if dailyamount <= 0 or dailylimit <= 0:
             return await interaction.response.send_message("**Aide désactivée** · L'aide économique quotidienne n'est pas disponible sur ce serveur", ephemeral=True)
         
+        account = self.get_account(user)
+        balance = account.balance
+        if balance >= dailylimit:
+            return await interaction.response.send_message(f"**Solde maximal atteint** · Vous avez déjà atteint la limite maximale donnant droit à l'aide quotidienne ({config['DailyLimit']}{config['Currency']})", ephemeral=True)
+        
         ignore_part = 0.1 * dailylimit # On ignore l'équivallent de 10% de la limite quotidienne dans le calcul de la réduction
-        if account.balance > ignore_part:
-            redux = (account.balance - ignore_part) / dailylimit
+        if balance > ignore_part:
+            redux = (balance - ignore_part) / dailylimit
             dailyamount = round(dailyamount * (1 - redux))
         
-        cond = Condition(self, 'LastDaily', user, default_value='')
-        if cond.check(lambda v: v == today):
-            return await interaction.response.send_message("**Déjà perçue** · Vous avez déjà récupéré votre aide quotidienne aujourd'hui, réessayez demain.", ephemeral=True)
-        
-        if account.balance >= dailylimit:
-            return await interaction.response.send_message(f"**Solde maximal atteint** · Vous avez déjà atteint la limite maximale donnant droit à l'aide quotidienne ({config['DailyLimit']}{config['Currency']})", ephemeral=True)
-        
         if dailyamount <= 0:
             return await interaction.response.send_message("**Solde trop élevé** · L'aide qu'il vous reste à percevoir est inférieure à un crédit", ephemeral=True)
         
-        trs = account.deposit(dailyamount, reason=f'Aide quotidienne du {today}')
-        cond.value = today
+        trs = account.deposit(dailyamount, reason=f"Aide quotidienne du {date.fromordinal(today).strftime('%d.%m.%Y')}")
+        self.set_last_daily(user, today)
         if is_premium:
             return await interaction.response.send_message(f"**Aide quotidienne récupérée** · **{trs.display_amount}** ont été ajoutés à votre compte au titre de l'aide économique quotidienne (**majorée** car vous boostez ce serveur)")
         await interaction.response.send_message(f"**Aide quotidienne récupérée** · **{trs.display_amount}** ont été ajoutés à votre compte au titre de l'aide économique quotidienne")
     
     @app_commands.command(name='leaderboard')
     @app_commands.guild_only()
-    async def _leaderboard(self, interaction: discord.Interaction):
+    @require_guild
+    async def _leaderboard(self, interaction: discord.Interaction, guild: discord.Guild):
         """Affiche un top 20 des comptes bancaires du serveur"""
-        guild = interaction.guild
-        if not isinstance(guild, discord.Guild):
-            return await interaction.response.send_message('**Membre inconnu** · Vous devez être présent sur le serveur', ephemeral=True)
-        
-        accounts = self.get_accounts_by_balance(guild)
-        if not accounts:
+        top = self.get_top_accounts(guild, 20)
+        if not top:
             return await interaction.response.send_message("**Aucun compte** · Aucun compte bancaire n'a été ouvert sur ce serveur")
         
         user = interaction.user
         if not isinstance(user, discord.Member):
             return await interaction.response.send_message('**Membre inconnu** · Vous devez être présent sur le serveur', ephemeral=True)
         
-        top = accounts[:20]
-        txt = '\n'.join([f'{i+1}. {a.owner.mention} · **{a.display_balance}**' for i, a in enumerate(top)])
+        currency = self.get_currency(guild)
+        txt = '\n'.join(f'{i+1}. {a.owner.mention} · **{a.balance}{currency}**' for i, a in enumerate(top))
         em = discord.Embed(title=f"Leaderboard · ***{guild.name}***", description=txt, color=0x2b2d31)
-        if user not in [a.owner for a in top]:
+        top_owner_ids = {a.owner.id for a in top}
+        if user.id not in top_owner_ids:
             em.add_field(name="Votre rang", value=pretty.codeblock(f'#{self.get_account_rank(self.get_account(user))}'))
-        em.set_footer(text=f"Total sur le serveur · {self.get_guild_total_balance(guild)}{self.get_currency(guild)}")
+        em.set_footer(text=f"Total sur le serveur · {self.get_guild_total_balance(guild)}{currency}")
         await interaction.response.send_message(embed=em)
         
     @app_commands.command(name='stats')
     @app_commands.guild_only()
-    async def _stats(self, interaction: discord.Interaction):
+    @require_guild
+    async def _stats(self, interaction: discord.Interaction, guild: discord.Guild):
         """Affiche diverses statistiques sur l'économie du serveur"""
-        guild = interaction.guild
-        if not isinstance(guild, discord.Guild):
-            return await interaction.response.send_message('**Membre inconnu** · Vous devez être présent sur le serveur', ephemeral=True)
-        
-        global_variation = self.get_transactions_since(guild, datetime.now() - timedelta(hours=24))
-        global_variation = sum([t.amount for t in global_variation])
+        global_variation = self.get_transactions_sum_since(guild, datetime.now() - timedelta(hours=24))
         currency = self.get_currency(guild)
         
+        accounts = self.get_accounts_by_balance(guild)
+        if not accounts:
+            return await interaction.response.send_message("**Aucun compte** · Aucun compte bancaire n'a été ouvert sur ce serveur")
+        
         em = discord.Embed(title=f"Statistiques de l'économie · ***{guild.name}***", color=0x2b2d31)
-        richest = self.get_accounts_by_balance(guild)[0]
+        richest = accounts[0]
         em.add_field(name="Plus riche", value=pretty.codeblock(f"{richest.owner.name} · {richest.balance}{currency}"))
         em.add_field(name="Moyenne", value=pretty.codeblock(str(self.get_guild_average_balance(guild)) + f'{currency}'))
         em.add_field(name="Médiane", value=pretty.codeblock(str(self.get_guild_median_balance(guild)) + f'{currency}'))
@@ -750,8 +1018,8 @@ class Economy(commands.Cog):
         
         account = self.get_account(user)
         account.reset()
-        default_balance = int(self.get_guild_config(user.guild)['DefaultBalance'])
-        await interaction.response.send_message(f"**Solde réinitialisé** · Le solde de {user.mention} a été réinitialisé à **{default_balance}{self.get_currency(user.guild)}**")
+        config = self.get_guild_config(user.guild)
+        await interaction.response.send_message(f"**Solde réinitialisé** · Le solde de {user.mention} a été réinitialisé à **{int(config['DefaultBalance'])}{config['Currency']}**")
         
     @config_commands.command(name='setbalance')
     @app_commands.rename(user='utilisateur', amount='montant')
@@ -769,15 +1037,13 @@ class Economy(commands.Cog):
         await interaction.response.send_message(f"**Solde modifié** · Le solde de {user.mention} a été modifié à **{amount}{self.get_currency(user.guild)}**")
         
     @config_commands.command(name='cancel')
-    async def _configbank_cancel(self, interaction: discord.Interaction, transaction_id: str):
+    @require_guild
+    async def _configbank_cancel(self, interaction: discord.Interaction, guild: discord.Guild, transaction_id: str):
         """Annule une transaction d'un utilisateur
 
         :param transaction_id: Identifiant de la transaction
         """
-        if not isinstance(interaction.guild, discord.Guild):
-            return await interaction.response.send_message('**Membre inconnu** · Vous devez être présent sur le serveur', ephemeral=True)
-        
-        trs = Transaction.from_id(self, interaction.guild, transaction_id)
+        trs = Transaction.from_id(self, guild, transaction_id)
         if not trs:
             return await interaction.response.send_message('**Introuvable** · Cette transaction n\'existe pas', ephemeral=True)
         
@@ -796,64 +1062,60 @@ class Economy(commands.Cog):
     async def transaction_id_autocomplete(self, interaction: discord.Interaction, current: str):
         if not isinstance(interaction.guild, discord.Guild):
             return []
-        last_trs = self.get_last_transactions(interaction.guild, limit=20)
-        r = fuzzy.finder(current, last_trs, key=lambda t: t.id)
-        choices = [app_commands.Choice(name=f'{trs.frelative} > {trs.user.name} {trs.amount:+}', value=trs.id) for trs in r]
-        return sorted(choices, key=lambda c: c.name)
+        cached = self._autocomplete_cache.get(interaction.guild.id)
+        if cached and time.monotonic() - cached[0] < AUTOCOMPLETE_CACHE_TTL:
+            last_trs = cached[1]
+        else:
+            last_trs = {trs.id: trs for trs in self.get_last_transactions(interaction.guild, limit=20)}
+            self._autocomplete_cache[interaction.guild.id] = (time.monotonic(), last_trs)
+        # La recherche se fait directement sur les identifiants, sans fonction de clé
+        r = fuzzy.finder(current, last_trs)
+        today = datetime.now().date()
+        # Les choix restent dans l'ordre de pertinence renvoyé par fuzzy.finder
+        return [app_commands.Choice(name=f'{trs.format_relative(today)} > {trs.user.name} {trs.amount:+}', value=trs.id) for trs in (last_trs[i] for i in r)]
     
     @config_commands.command(name='currency')
     @app_commands.rename(currency='symbole')
-    async def _configbank_currency(self, interaction: discord.Interaction, currency: str):
+    @require_guild
+    async def _configbank_currency(self, interaction: discord.Interaction, guild: discord.Guild, currency: str):
         """Modifie le symbole de la monnaie du serveur
         
         :param currency: Symbole de la monnaie
         """
-        guild = interaction.guild
-        if not isinstance(guild, discord.Guild):
-            return await interaction.response.send_message('**Membre inconnu** · Vous devez être présent sur le serveur', ephemeral=True)
-        
-        # On vérifie que le symbole soit valide (unicode)
-        if not currency.isprintable() or currency.isspace():
-            return await interaction.response.send_message('**Invalide** · Le symbole de la monnaie doit être un caractère unicode non-vide et imprimable', ephemeral=True)
-        
-        if len(currency) > 3:
-            return await interaction.response.send_message('**Invalide** · Le symbole de la monnaie ne peut pas dépasser 3 caractères', ephemeral=True)
+        # On vérifie que le symbole soit valide (unicode, 3 caractères max.)
+        if not _CURRENCY_RE.fullmatch(currency) or not currency.isprintable():
+            return await interaction.response.send_message('**Invalide** · Le symbole de la monnaie doit être composé de 1 à 3 caractères unicode imprimables', ephemeral=True)
         
         self.set_guild_config(guild, 'Currency', currency)
         await interaction.response.send_message(f"**Paramètre modifié** · Le symbole de la monnaie a été modifié pour `{currency}`")
         
     @config_commands.command(name='daily')
     @app_commands.rename(amount='montant', limit='limite')
-    async def _configbank_daily(self, interaction: discord.Interaction, amount: app_commands.Range[int, 0], limit: app_commands.Range[int, 0], premium: app_commands.Range[int, 0]):
+    @require_guild
+    async def _configbank_daily(self, interaction: discord.Interaction, guild: discord.Guild, amount: app_commands.Range[int, 0], limit: app_commands.Range[int, 0], premium: app_commands.Range[int, 0]):
         """Modifie les paramètres de l'aide économique quotidienne (0 pour désactiver)
 
         :param amount: Montant de l'aide quotidienne
         :param limit: Limite de solde pour recevoir l'aide quotidienne
         :param premium: Majoration de l'aide quotidienne pour les boosters du serveur
         """
-        guild = interaction.guild
-        if not isinstance(guild, discord.Guild):
-            return await interaction.response.send_message('**Membre inconnu** · Vous devez être présent sur le serveur', ephemeral=True)
-        
         self.set_guild_config(guild, 'DailyAmount', amount)
         self.set_guild_config(guild, 'DailyLimit', limit)
         self.set_guild_config(guild, 'PremiumDailyAmount', premium)
         if amount == 0 or limit == 0:
             await interaction.response.send_message(f"**Paramètres modifiés** · L'aide économique quotidienne a été désactivée")
         else:
-            await interaction.response.send_message(f"**Paramètres modifiés** · L'aide économique quotidienne a été modifiée pour `{amount}{self.get_currency(guild)}` avec une limite de `{limit}{self.get_currency(guild)}` et une majoration de `{premium}{self.get_currency(guild)}` pour les boosters du serveur")
+            currency = self.get_currency(guild)
+            await interaction.response.send_message(f"**Paramètres modifiés** · L'aide économique quotidienne a été modifiée pour `{amount}{currency}` avec une limite de `{limit}{currency}` et une majoration de `{premium}{currency}` pour les boosters du serveur")
     
     @config_commands.command(name='defaultbalance')
     @app_commands.rename(amount='montant')
-    async def _configbank_defaultbalance(self, interaction: discord.Interaction, amount: app_commands.Range[int, 0]):
+    @require_guild
+    async def _configbank_defaultbalance(self, interaction: discord.Interaction, guild: discord.Guild, amount: app_commands.Range[int, 0]):
         """Modifie le solde par défaut des comptes bancaires lors de leur création
 
         :param amount: Solde par défaut
         """
-        guild = interaction.guild
-        if not isinstance(guild, discord.Guild):
-            return await interaction.response.send_message('**Membre inconnu** · Vous devez être présent sur le serveur', ephemeral=True)
-        
         self.set_guild_config(guild, 'DefaultBalance', amount)
         await interaction.response.send_message(f"**Paramètre modifié** · Le solde par défaut a été modifié pour `{amount}{self.get_currency(guild)}`")
     
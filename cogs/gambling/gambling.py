@@ -1,18 +1,52 @@
 import logging
 import re
-from typing import Dict, Optional
+import sqlite3
+from typing import Dict, NamedTuple, Optional
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 from tabulate import tabulate
 
-from cogs.economy.economy import Economy
+from cogs.economy.economy import Account, Economy
 from common import dataio
-from common.utils import fuzzy, pretty
+from common.utils import pretty
 
 logger = logging.getLogger(f'Analog.{__name__.capitalize()}')    
 
+# Séparateurs acceptés entre les choix d'un pari
+_CHOICES_SPLIT_RE = re.compile(r'[,|;]')
+
+# Réglages SQLite appliqués à l'ouverture de chaque connexion aux bases de données des serveurs
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=67108864",
+    "PRAGMA cache_size=-8000"
+)
+
+class Betting(NamedTuple):
+    """Pari en cours sur un salon"""
+    channel_id: int
+    title: str
+    choices: tuple[str, ...]
+    choices_set: frozenset[str]
+    message_id: int
+    minimal_bet: int
+    author_id: int
+    
+    @classmethod
+    def from_columns(cls, channel_id: int, title: str, choices: str, message_id: int, minimal_bet: int, author_id: int) -> 'Betting':
+        """Crée un pari à partir des colonnes de la table bettings (choix séparés par des virgules)"""
+        choices_tuple = tuple(choices.split(','))
+        return cls(channel_id, title, choices_tuple, frozenset(choices_tuple), message_id, minimal_bet, author_id)
+    
+class Bet(NamedTuple):
+    """Mise d'un membre sur un pari"""
+    choice: str
+    amount: int
+
 class ConfirmationView(discord.ui.View):
     """Ajoute un bouton de confirmation et d'annulation à un message"""
     def __init__(self, *, custom_labels: tuple[str, str] | None = None, timeout: float | None = 60):
@@ -39,7 +73,10 @@ class Gambling(commands.Cog):
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.data = dataio.get_cog_data(self)
+        self.data = dataio.get_cog_data(self, pragmas=SQLITE_PRAGMAS)
+        
+        # Cache des paris en cours, indexés par ID de salon
+        self._betting_cache : Dict[int, Betting] = {}
         
     def _init_guilds_db(self, guild: discord.Guild | None = None):
         guilds = [guild] if guild else list(self.bot.guilds)
@@ -55,18 +92,43 @@ class Gambling(commands.Cog):
             self.data.execute(g, bettings)
             
             bets = """CREATE TABLE IF NOT EXISTS bets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id INTEGER PRIMARY KEY,
                 user_id INTEGER,
                 channel_id INTEGER,
                 choice TEXT,
                 amount INTEGER,
                 FOREIGN KEY (channel_id) REFERENCES bettings (channel_id)
                 )"""
+            # Les IDs des paris ne sont jamais exposés : on retire l'AUTOINCREMENT des anciennes tables
+            r = self.data.fetchone(g, """SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'bets'""")
+            if r and 'AUTOINCREMENT' in r['sql']:
+                with self.data.transaction(g):
+                    self.data.execute(g, """ALTER TABLE bets RENAME TO bets_old""")
+                    self.data.execute(g, bets)
+                    self.data.execute(g, """INSERT INTO bets SELECT * FROM bets_old""")
+                    self.data.execute(g, """DROP TABLE bets_old""")
             self.data.execute(g, bets)
+            self.data.execute(g, """CREATE INDEX IF NOT EXISTS idx_bets_channel_choice ON bets (channel_id, choice)""")
+            # Un seul pari par membre et par salon : l'index unique remplace l'ancien index simple
+            if not self.data.fetchone(g, """SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_bets_channel_user_uniq'"""):
+                with self.data.transaction(g):
+                    # Les mises en double ont toutes été retirées des comptes : elles sont cumulées dans le pari conservé (le plus récent)
+                    duplicates = self.data.fetchall(g, """SELECT channel_id, user_id, GROUP_CONCAT(choice || ':' || amount) AS bets FROM bets GROUP BY channel_id, user_id HAVING COUNT(*) > 1""")
+                    for d in duplicates:
+                        logger.warning(f"Paris en double fusionnés sur {g} (salon {d['channel_id']}, membre {d['user_id']}) : {d['bets']}")
+                    self.data.execute(g, """UPDATE bets SET amount = (SELECT SUM(b.amount) FROM bets b WHERE b.channel_id = bets.channel_id AND b.user_id = bets.user_id)
+                        WHERE id IN (SELECT MAX(id) FROM bets GROUP BY channel_id, user_id HAVING COUNT(*) > 1)""")
+                    self.data.execute(g, """DELETE FROM bets WHERE id NOT IN (SELECT MAX(id) FROM bets GROUP BY channel_id, user_id)""")
+                    self.data.execute(g, """DROP INDEX IF EXISTS idx_bets_channel_user""")
+                    self.data.execute(g, """CREATE UNIQUE INDEX idx_bets_channel_user_uniq ON bets (channel_id, user_id)""")
         
     @commands.Cog.listener()
     async def on_ready(self):
         self._init_guilds_db()
+        # Les paris en cours sont chargés en cache dès le démarrage pour l'autocomplétion
+        for guild in self.bot.guilds:
+            for betting in self.get_all_bettings(guild):
+                self._cache_betting(betting)
         
         await self.bot.wait_until_ready()
         self.economy : Economy = self.bot.get_cog('Economy') # type: ignore
@@ -83,67 +145,76 @@ class Gambling(commands.Cog):
         
     # BETTINGS ---------------------------------------------------------------
     
-    def get_betting(self, channel: discord.TextChannel | discord.Thread) -> Optional[Dict]:
+    def get_betting(self, channel: discord.TextChannel | discord.Thread) -> Optional[Betting]:
         """Récupère les informations d'un pari."""
-        query = """SELECT * FROM bettings WHERE channel_id = ?"""
+        if channel.id in self._betting_cache:
+            return self._betting_cache[channel.id]
+        query = """SELECT title, choices, message_id, minimal_bet, author_id FROM bettings WHERE channel_id = ?"""
         r = self.data.fetchone(channel.guild, query, (channel.id,))
         if r:
-            return dict(r)
+            return self._cache_betting(Betting.from_columns(channel.id, *r))
         return None
     
-    def get_all_bettings(self, guild: discord.Guild) -> list[Dict]:
+    def _cache_betting(self, betting: Betting) -> Betting:
+        """Met en cache un pari."""
+        self._betting_cache[betting.channel_id] = betting
+        return betting
+    
+    def get_all_bettings(self, guild: discord.Guild) -> list[Betting]:
         """Récupère les informations de tous les paris d'un serveur."""
-        query = """SELECT * FROM bettings"""
+        query = """SELECT channel_id, title, choices, message_id, minimal_bet, author_id FROM bettings"""
         r = self.data.fetchall(guild, query)
-        if r:
-            return [dict(b) for b in r]
-        return []
+        return [Betting.from_columns(*b) for b in r]
     
     def set_betting(self, channel: discord.TextChannel | discord.Thread, title: str, choices: list[str], message: discord.Message, minimal_bet: int, author: discord.User | discord.Member):
         """Crée ou met à jour un pari."""
-        query = """INSERT OR REPLACE INTO bettings VALUES (?, ?, ?, ?, ?, ?)"""
-        self.data.execute(channel.guild, query, (channel.id, title, ','.join([c.lower() for c in choices]), message.id, minimal_bet, author.id))
+        query = """INSERT INTO bettings (channel_id, title, choices, message_id, minimal_bet, author_id) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (channel_id) DO UPDATE SET title = excluded.title, choices = excluded.choices, message_id = excluded.message_id, minimal_bet = excluded.minimal_bet, author_id = excluded.author_id"""
+        values = (channel.id, title, ','.join([c.lower() for c in choices]), message.id, minimal_bet, author.id)
+        self.data.execute(channel.guild, query, values)
+        self._cache_betting(Betting.from_columns(*values))
     
     def delete_betting(self, channel: discord.TextChannel | discord.Thread):
         """Supprime un pari."""
         query = """DELETE FROM bettings WHERE channel_id = ?"""
         self.data.execute(channel.guild, query, (channel.id,))
+        self._betting_cache.pop(channel.id, None)
     
     # BETS -------------------------------------------------------------------
     
-    def get_bets(self, channel: discord.TextChannel | discord.Thread) -> list[Dict]:
+    def get_bets(self, channel: discord.TextChannel | discord.Thread) -> list[sqlite3.Row]:
         """Récupère les paris d'un pari."""
         query = """SELECT * FROM bets WHERE channel_id = ?"""
+        return self.data.fetchall(channel.guild, query, (channel.id,))
+    
+    def get_bet_totals(self, channel: discord.TextChannel | discord.Thread) -> Dict[str, tuple[int, int]]:
+        """Récupère le total misé et le nombre de parieurs pour chaque choix d'un pari."""
+        query = """SELECT choice, SUM(amount) AS total, COUNT(*) AS bettors FROM bets WHERE channel_id = ? GROUP BY choice"""
         r = self.data.fetchall(channel.guild, query, (channel.id,))
-        if r:
-            return [dict(b) for b in r]
-        return []
+        return {row['choice']: (row['total'], row['bettors']) for row in r}
     
-    def get_bet(self, channel: discord.TextChannel | discord.Thread, user: discord.User | discord.Member) -> Optional[Dict]:
+    def get_winning_bets(self, channel: discord.TextChannel | discord.Thread, choice: str) -> list[sqlite3.Row]:
+        """Récupère les paris réalisés sur un choix, triés par mise décroissante."""
+        query = """SELECT user_id, amount FROM bets WHERE channel_id = ? AND choice = ? ORDER BY amount DESC"""
+        return self.data.fetchall(channel.guild, query, (channel.id, choice))
+    
+    def get_bet(self, channel: discord.TextChannel | discord.Thread, user: discord.User | discord.Member) -> Optional[Bet]:
         """Récupère le pari d'un utilisateur."""
-        query = """SELECT * FROM bets WHERE channel_id = ? AND user_id = ?"""
+        query = """SELECT choice, amount FROM bets WHERE channel_id = ? AND user_id = ?"""
         r = self.data.fetchone(channel.guild, query, (channel.id, user.id))
         if r:
-            return dict(r)
+            return Bet(*r)
         return None
     
     def set_bet(self, channel: discord.TextChannel | discord.Thread, user: discord.User | discord.Member, choice: str, amount: int):
         """Crée ou met à jour un pari."""
-        # On vérifie que le pari existe
+        # On vérifie que le pari existe (lecture en cache)
         if not self.get_betting(channel):
             raise ValueError(f"Le pari n'existe pas.")
         
-        choice = choice.lower()
-        
-        # On update s'il ajoute de l'argent
-        current_bet = self.get_bet(channel, user)
-        if current_bet: # Il a déjà parié
-            query = """UPDATE bets SET choice = ?, amount = ? WHERE channel_id = ? AND user_id = ?"""
-            self.data.execute(channel.guild, query, (choice, amount, channel.id, user.id))
-            return
-        
-        query = """INSERT INTO bets VALUES (?, ?, ?, ?, ?)"""
-        self.data.execute(channel.guild, query, (None, user.id, channel.id, choice, amount))
+        query = """INSERT INTO bets (user_id, channel_id, choice, amount) VALUES (?, ?, ?, ?)
+            ON CONFLICT (channel_id, user_id) DO UPDATE SET choice = excluded.choice, amount = excluded.amount"""
+        self.data.execute(channel.guild, query, (user.id, channel.id, choice.lower(), amount))
         
     def delete_bet(self, channel: discord.TextChannel | discord.Thread, user: discord.User | discord.Member):
         """Supprime un pari."""
@@ -155,81 +226,106 @@ class Gambling(commands.Cog):
         query = """DELETE FROM bets WHERE channel_id = ?"""
         self.data.execute(channel.guild, query, (channel.id,))
         
+    def place_bet(self, channel: discord.TextChannel | discord.Thread, account: Account, choice: str, stake: int, title: str) -> int:
+        """Ajoute la mise d'un membre à son pari (ou le crée) puis la retire de son compte, et renvoie le montant total parié.
+        
+        Les paris et les soldes (Economy) sont dans deux fichiers SQLite distincts : les deux écritures ne sont pas atomiques. Le retrait est validé en dernier et le pari est rétabli dans son état précédent s'il échoue."""
+        member = account.owner
+        # Le pari actuel est relu dans la même transaction que son écriture
+        with self.data.transaction(channel.guild):
+            previous = self.get_bet(channel, member)
+            if previous and previous.choice != choice.lower():
+                raise ValueError(f"Le membre a déjà parié sur un autre choix.")
+            total = stake + (previous.amount if previous else 0)
+            self.set_bet(channel, member, choice, total)
+        try:
+            account.withdraw(stake, reason=f"Pari sur {title}")
+        except BaseException:
+            if previous:
+                self.set_bet(channel, member, previous.choice, previous.amount)
+            else:
+                self.delete_bet(channel, member)
+            raise
+        return total
+        
     async def handle_winners(self, channel: discord.TextChannel | discord.Thread, result: str):
         """Attribue les gains aux gagnants d'un pari et les notifie."""
         data = self.get_betting(channel)
         if not data:
             raise ValueError(f"Le pari n'existe pas.")
         
-        # On récupère les paris
-        bets = self.get_bets(channel)
-        if not bets:
+        # On récupère les totaux des mises par choix
+        totals = self.get_bet_totals(channel)
+        if not totals:
             return
         
-        bet_channel = channel.guild.get_channel(data['channel_id'])
+        bet_channel = channel.guild.get_channel(data.channel_id)
         if not bet_channel or not isinstance(bet_channel, (discord.TextChannel, discord.Thread)):
             return await channel.send(f"**Salon invalide** · Le salon du pari n'existe plus ou n'est plus accessible.")
         
         # On récupère le choix gagnant
         winner = result.lower()
-        if winner not in data['choices'].split(','):
+        if winner not in data.choices_set:
             return await channel.send(f"**Choix invalide** · Le choix `{winner}` n'existe pas.")
         
         # On calcule le total des mises
-        total_w = sum([b['amount'] for b in bets if b['choice'] == winner])
-        total_full = sum([b['amount'] for b in bets])
+        total_w = totals.get(winner, (0, 0))[0]
+        total_full = sum(total for total, _ in totals.values())
         if not total_full:
             return await channel.send(f"**Aucun pari** · Personne n'a parié sur ce pari.")
         
-        # On récupère les gagnants
-        winners = [b for b in bets if b['choice'] == winner]
+        # On récupère les gagnants, déjà triés par mise décroissante
+        winners = self.get_winning_bets(channel, winner)
         if not winners:
-            embed = self.get_betting_embed(channel, highlight_result=winner, display_members=False)
+            embed = self.get_betting_embed(channel, highlight_result=winner, display_members=False, betting=data, totals=totals)
             embed.set_author(name="Pari terminé · Résultats")
-            return await channel.send(f"# Pari terminé · `{data['title']}`\nPersonne n'a parié sur `{winner.capitalize()}` ! Il n'y a donc pas de gagnant.\n### Résultats", embed=embed)
+            return await channel.send(f"# Pari terminé · `{data.title}`\nPersonne n'a parié sur `{winner.capitalize()}` ! Il n'y a donc pas de gagnant.\n### Résultats", embed=embed)
 
-        embed = self.get_betting_embed(channel, highlight_result=winner, display_members=False)
+        embed = self.get_betting_embed(channel, highlight_result=winner, display_members=False, betting=data, totals=totals)
         embed.set_author(name="Pari terminé · Résultats")
         
         # On distribue les gains
         table = []
         mentions = []
         currency = self.economy.get_currency(channel.guild)
-        winners = sorted(winners, key=lambda w: w['amount'], reverse=True)
+        deposits = []
         for w in winners:
             member = channel.guild.get_member(w['user_id'])
-            # Les gains sont proportionnels à la mise de chaque gagnant
-            amount = round(w['amount'] / total_w * total_full)
+            # Les gains sont proportionnels à la mise de chaque gagnant (arrondis à l'inférieur pour ne jamais dépasser le total des mises)
+            amount = w['amount'] * total_full // total_w
             if not member:
                 table.append((w['user_id'], amount))
             else:
                 table.append((str(member), f'+{amount}{currency}'))
-                account = self.economy.get_account(member)
-                account.deposit(amount, reason=f"Gains du pari {data['title']}")
+                deposits.append((member, amount, f"Gains du pari {data.title}"))
                 mentions.append(member.mention)
+        # Tous les gains sont versés en une seule mise à jour groupée
+        self.economy.deposit_many(channel.guild, deposits)
         
         embed.add_field(name="Gagnants" if len(winners) > 1 else "Gagnant", value=pretty.codeblock(tabulate(table, headers=('Membre', 'Gains'))), inline=False)
         # On notifie les gagnants
-        await bet_channel.send(f"# **Pari terminé** · `{data['title']}`\n{' '.join(mentions)}\n### Résultats", embed=embed)
+        await bet_channel.send(f"# **Pari terminé** · `{data.title}`\n{' '.join(mentions)}\n### Résultats", embed=embed)
        
     # DISPLAY ----------------------------------------------------------------
     
-    def get_betting_embed(self, channel: discord.TextChannel | discord.Thread, *, highlight_result: str | None = None, display_members: bool = True) -> discord.Embed:
-        """Renvoie un embed avec les informations du pari mis à jour."""
-        data = self.get_betting(channel)
+    def get_betting_embed(self, channel: discord.TextChannel | discord.Thread, *, highlight_result: str | None = None, display_members: bool = True, betting: Optional[Betting] = None, totals: Optional[Dict[str, tuple[int, int]]] = None) -> discord.Embed:
+        """Renvoie un embed avec les informations du pari mis à jour (le pari et les totaux des mises peuvent être fournis s'ils ont déjà été chargés)."""
+        data = betting or self.get_betting(channel)
         if not data:
             raise ValueError(f"Le pari n'existe pas.")
         
         currency = self.economy.get_currency(channel.guild)
         embed = discord.Embed(color=0x2b2d31)
         
+        if totals is None:
+            totals = self.get_bet_totals(channel)
+        bettors = sum(count for _, count in totals.values())
         author_text = f"Pari en cours" if not highlight_result else f"Pari terminé"
-        author_text += f" · {len(self.get_bets(channel))} parieur{'s' if len(self.get_bets(channel)) > 1 else ''}"
+        author_text += f" · {bettors} parieur{'s' if bettors > 1 else ''}"
         embed.set_author(name=author_text)
-        bets = self.get_bets(channel)
         table = []
-        choices = data['choices'].split(',')
-        if not bets:
+        choices = data.choices
+        if not totals:
             for choice in choices:
                 if highlight_result:
                     if highlight_result == choice:
@@ -239,9 +335,9 @@ class Gambling(commands.Cog):
                 else:
                     table.append((choice.capitalize(), 0, ''))
         else:
-            total = sum([b['amount'] for b in bets])
+            total = sum(amount for amount, _ in totals.values())
             for choice in choices:
-                amount = sum([b['amount'] for b in bets if b['choice'] == choice])
+                amount = totals.get(choice, (0, 0))[0]
                 bar = pretty.bar_chart(amount, total, lenght=7, display_percent=True)
                 if highlight_result:
                     if highlight_result == choice:
@@ -251,10 +347,11 @@ class Gambling(commands.Cog):
                 else:
                     table.append((choice.capitalize(), f'{amount}{currency}', bar))
                 
-        embed.description = f"# *`{data['title']}`*\n" + pretty.codeblock(tabulate(table, tablefmt='plain'), lang='diff')
+        embed.description = f"# *`{data.title}`*\n" + pretty.codeblock(tabulate(table, tablefmt='plain'), lang='diff')
         
         # Afficher les participants
-        if bets and display_members:
+        bets = self.get_bets(channel) if totals and display_members else []
+        if bets:
             parts = []
             for bet in bets:
                 member = channel.guild.get_member(bet['user_id'])
@@ -266,7 +363,7 @@ class Gambling(commands.Cog):
             if parts:
                 embed.add_field(name="Participants", value=pretty.codeblock(tabulate(parts, tablefmt='plain')), inline=False)
         
-        author = channel.guild.get_member(data['author_id'])
+        author = channel.guild.get_member(data.author_id)
         if author:
             avatar = author.display_avatar.url
         elif channel.guild.icon:
@@ -274,8 +371,8 @@ class Gambling(commands.Cog):
         else:
             avatar = None
         
-        if data['minimal_bet'] > 1:
-            embed.set_footer(text=f"Pariez avec /bet · Minimum {data['minimal_bet']}{self.economy.get_currency(channel.guild)}", icon_url=avatar)
+        if data.minimal_bet > 1:
+            embed.set_footer(text=f"Pariez avec /bet · Minimum {data.minimal_bet}{currency}", icon_url=avatar)
         else:
             embed.set_footer(text="Pariez avec /bet", icon_url=avatar)
         return embed
@@ -287,10 +384,11 @@ class Gambling(commands.Cog):
             raise ValueError(f"Le pari n'existe pas.")
         
         if result:
-            embed = self.get_betting_embed(channel, highlight_result=result)
+            embed = self.get_betting_embed(channel, highlight_result=result, betting=data)
         else:
-            embed = self.get_betting_embed(channel)
-        message = await channel.fetch_message(data['message_id'])
+            embed = self.get_betting_embed(channel, betting=data)
+        # Un message partiel suffit pour modifier le message sans le récupérer au préalable
+        message = channel.get_partial_message(data.message_id)
         await message.edit(embed=embed, content=None)
         
     # COMMANDES ===============================================================
@@ -316,11 +414,11 @@ class Gambling(commands.Cog):
         if len(title) > 100:
             return await interaction.response.send_message("**Titre invalide** · Le titre ne peut pas dépasser 100 caractères.", ephemeral=True)
         
-        chx = [c.strip().lower() for c in re.split(r'[,|;]', choices) if c]
+        chx = [c.strip().lower() for c in _CHOICES_SPLIT_RE.split(choices) if c]
         if len(chx) < 2 or len(chx) > 4:
             return await interaction.response.send_message("**Choix invalides** · Vous devez spécifier entre 2 et 4 choix possibles.", ephemeral=True)
         
-        if any([len(c) > 20 for c in chx]):
+        if any(len(c) > 20 for c in chx):
             return await interaction.response.send_message("**Choix invalides** · Les choix ne peuvent pas dépasser 20 caractères.", ephemeral=True)
         
         message = await channel.send("`⏳` **Chargement de l'affichage des résultats...**")
@@ -352,7 +450,7 @@ class Gambling(commands.Cog):
         
         # Il faut que ce soit un modérateur ou l'auteur du pari
         if not channel.permissions_for(interaction.user).manage_messages: # type: ignore
-            author = channel.guild.get_member(betting['author_id'])
+            author = channel.guild.get_member(betting.author_id)
             if not author or interaction.user != author:
                 return await interaction.response.send_message(f"**Autorisation insuffisante** · Vous devez être modérateur ou l'auteur du pari pour l'arrêter.", ephemeral=True)
         
@@ -367,11 +465,11 @@ class Gambling(commands.Cog):
             return await interaction.edit_original_response(content=f"**Arrêt annulé** · Le pari n'a pas été arrêté.", view=None)
         
         # On vérifie que le résultat est valide 
-        if result.lower() not in betting['choices'].split(','):
+        if result.lower() not in betting.choices_set:
             return await interaction.followup.send(f"**Résultat invalide** · Le résultat `{result}` n'existe pas.", ephemeral=True)
         
         alert = ""
-        bet_message = await channel.fetch_message(betting['message_id'])
+        bet_message = await channel.fetch_message(betting.message_id)
         if not bet_message:
             pass
         elif bet_message.pinned:
@@ -381,8 +479,9 @@ class Gambling(commands.Cog):
                 alert = "\n**Attention** · Je n'ai pas pu désépingler le message du pari. Assurez-vous que j'ai la permission `Gérer les messages` sur ce salon."
         
         await self.handle_winners(channel, result)
-        self.delete_betting(channel)
-        self.delete_all_bets(channel)
+        with self.data.transaction(channel.guild):
+            self.delete_betting(channel)
+            self.delete_all_bets(channel)
         await interaction.delete_original_response()
         
         await interaction.followup.send(content=f"**Pari arrêté** · Le pari a été arrêté sur ce salon.{alert}", ephemeral=True)
@@ -400,7 +499,7 @@ class Gambling(commands.Cog):
         
         # Il faut que ce soit un modérateur ou l'auteur du pari
         if not channel.permissions_for(interaction.user).manage_messages: # type: ignore
-            author = channel.guild.get_member(betting['author_id'])
+            author = channel.guild.get_member(betting.author_id)
             if not author or interaction.user != author:
                 return await interaction.response.send_message(f"**Autorisation insuffisante** · Vous devez être modérateur ou l'auteur du pari pour l'annuler.", ephemeral=True)
         
@@ -417,24 +516,21 @@ class Gambling(commands.Cog):
         # On rembourse les participants
         bets = self.get_bets(channel)
         if bets:
-            for bet in bets:
-                member = channel.guild.get_member(bet['user_id'])
-                if not member:
-                    continue
-                account = self.economy.get_account(member)
-                account.deposit(bet['amount'], reason=f"Remboursement du pari {betting['title']}")
+            reason = f"Remboursement du pari {betting.title}"
+            members = ((channel.guild.get_member(bet['user_id']), bet['amount']) for bet in bets)
+            self.economy.deposit_many(channel.guild, [(member, amount, reason) for member, amount in members if member])
         else:
             return await interaction.followup.send(f"**Aucun pari** · Personne n'a parié sur ce pari.", ephemeral=True)
 
-        self.delete_betting(channel)
-        self.delete_all_bets(channel)
+        with self.data.transaction(channel.guild):
+            self.delete_betting(channel)
+            self.delete_all_bets(channel)
         await interaction.delete_original_response()
         
-        bet_message = await channel.fetch_message(betting['message_id'])
-        if bet_message:
-            await bet_message.delete()
+        bet_message = channel.get_partial_message(betting.message_id)
+        await bet_message.delete()
         
-        await interaction.followup.send(content=f"**Pari annulé** · Le pari `{betting['title']}` en cours ce salon a été annulé.\nTous les participants ont été remboursés.")
+        await interaction.followup.send(content=f"**Pari annulé** · Le pari `{betting.title}` en cours ce salon a été annulé.\nTous les participants ont été remboursés.")
         
     @app_commands.command(name='bet')
     @app_commands.guild_only()
@@ -456,46 +552,47 @@ class Gambling(commands.Cog):
         if not data:
             return await interaction.response.send_message(f"**Aucun pari en cours** · Aucun pari n'est en cours sur ce salon.", ephemeral=True)
         
-        if choice not in data['choices'].split(','):
+        if choice not in data.choices_set:
             return await interaction.response.send_message(f"**Choix invalide** · Le choix `{choice}` n'existe pas.", ephemeral=True)
         
-        if amount < data['minimal_bet']:
-            return await interaction.response.send_message(f"**Mise trop faible** · La mise minimale est de {data['minimal_bet']}{currency}.", ephemeral=True)
+        if amount < data.minimal_bet:
+            return await interaction.response.send_message(f"**Mise trop faible** · La mise minimale est de {data.minimal_bet}{currency}.", ephemeral=True)
         
         await interaction.response.defer(ephemeral=True)
         account = self.economy.get_account(interaction.user)
         if account.balance < amount:
             return await interaction.followup.send(f"**Solde insuffisant** · Vous n'avez pas assez d'argent pour parier {amount}{currency}.", ephemeral=True)
         
-        bet_message_link = f"https://discord.com/channels/{channel.guild.id}/{channel.id}/{data['message_id']}"
+        bet_message_link = f"https://discord.com/channels/{channel.guild.id}/{channel.id}/{data.message_id}"
         bet_message_button = discord.ui.Button(label="Voir l'affichage", url=bet_message_link)
         bet_message_view = discord.ui.View()
         bet_message_view.add_item(bet_message_button)
         
         current_bet = self.get_bet(channel, interaction.user)
         if not current_bet: # Aucun pari réalisé
-            self.set_bet(channel, interaction.user, choice, amount)
-            account.withdraw(amount, reason=f"Pari sur {data['title']}")
+            self.place_bet(channel, account, choice, amount, data.title)
 
             await interaction.followup.send(f"**Pari enregistré** · Vous avez parié {amount}{currency} sur `{choice.capitalize()}`.", view=bet_message_view)
-        elif current_bet['choice'] == choice: # Même choix, il peut ajouter de l'argent
+        elif current_bet.choice == choice: # Même choix, il peut ajouter de l'argent
             
             # Message de confirmation
             view = ConfirmationView(custom_labels=('Ajouter', 'Annuler'))
-            await interaction.followup.send(f"**Pari déjà enregistré** · Vous avez déjà parié {current_bet['amount']}{currency} sur `{choice.capitalize()}`.\nVoulez-vous ajouter {amount}{currency} à votre pari ?", view=view, ephemeral=True)
+            await interaction.followup.send(f"**Pari déjà enregistré** · Vous avez déjà parié {current_bet.amount}{currency} sur `{choice.capitalize()}`.\nVoulez-vous ajouter {amount}{currency} à votre pari ?", view=view, ephemeral=True)
             await view.wait()
             if view.value is None:
                 return await interaction.edit_original_response(content="**Ajout annulé** · Vous n'avez pas répondu à temps.", view=None)
             elif view.value is False:
                 return await interaction.edit_original_response(content=f"**Ajout annulé** · Vous n'avez pas ajouté {amount}{currency} à votre pari.", view=None)
             
-            new_bet = current_bet['amount'] + amount
-            account.withdraw(amount, reason=f"Pari sur {data['title']}")
-            self.set_bet(channel, interaction.user, choice, new_bet)
+            # Le pari a pu être arrêté, remplacé ou modifié pendant la confirmation
+            if self.get_betting(channel) != data or self.get_bet(channel, interaction.user) != current_bet:
+                return await interaction.edit_original_response(content="**Ajout annulé** · Le pari a été arrêté ou modifié entre-temps.", view=None)
+            
+            new_bet = self.place_bet(channel, account, choice, amount, data.title)
             
             await interaction.edit_original_response(content=f"**Pari mis à jour** · Vous avez ajouté {new_bet:+}{currency} sur `{choice.capitalize()}`.\nAu total, vous avez parié {new_bet}{currency} dessus.", view=None)
         else: # Il ne peut pas changer de choix
-            return await interaction.followup.send(f"**Pari déjà enregistré** · Vous avez déjà parié {current_bet['amount']}{currency} sur `{current_bet['choice'].capitalize()}`.", ephemeral=True)
+            return await interaction.followup.send(f"**Pari déjà enregistré** · Vous avez déjà parié {current_bet.amount}{currency} sur `{current_bet.choice.capitalize()}`.", ephemeral=True)
         await self.update_display(channel)
     
     @_bet_choice.autocomplete('choice')
@@ -503,11 +600,13 @@ class Gambling(commands.Cog):
     async def _choice_autocomplete(self, interaction: discord.Interaction, current: str):
         if not isinstance(interaction.channel, (discord.TextChannel, discord.Thread)):
             return []
-        data = self.get_betting(interaction.channel)
+        # Aucune requête SQL : seuls les paris en cache (tous les paris en cours) sont proposés
+        data = self._betting_cache.get(interaction.channel.id)
         if not data:
             return []
-        r = fuzzy.finder(current, [c for c in data['choices'].split(',')])
-        return [app_commands.Choice(name=c.capitalize(), value=c) for c in r]
+        # Les choix sont peu nombreux et courts : une recherche de sous-chaîne suffit
+        current = current.lower()
+        return [app_commands.Choice(name=c.capitalize(), value=c) for c in data.choices if current in c]
     
 async def setup(bot):
     cog = Gambling(bot)
@@ -1,36 +1,120 @@
 import logging
+import math
 import random
-import re
-from typing import Any
+from collections import Counter, OrderedDict
+from typing import Any, Iterator
 
 import discord
 from discord import app_commands
 from discord.ext import commands
-from tabulate import tabulate
 
 from common import dataio
 from common.utils import pretty
 
 logger = logging.getLogger(f'Analog.{__name__.capitalize()}')
 
+# Nombre maximal de combinaisons tirées en un seul appel au générateur aléatoire
+_BATCH_ROLL_LIMIT = 2 ** 256
+# Nombre maximal de combinaisons tirées depuis un seul mot de 64 bits (biais inférieur à 2^-32)
+_LEMIRE_ROLL_LIMIT = 2 ** 32
+_MASK64 = (1 << 64) - 1
+
+# Requêtes des jets de dés sauvegardés (texte SQL constant, réutilisé par le cache de requêtes préparées de sqlite3)
+_SQL_LOAD_THROW = """SELECT throw FROM throws WHERE name = ?"""
+_SQL_SAVE_THROW = """INSERT OR REPLACE INTO throws VALUES (?, ?)"""
+_SQL_DELETE_THROW = """DELETE FROM throws WHERE name = ?"""
+_SQL_LIST_THROWS = """SELECT name, throw FROM throws"""
+
+THROW_CACHE_SIZE = 256 # Nombre de jets sauvegardés gardés en mémoire
+LAST_THROWS_SIZE = 1024 # Nombre de membres dont le dernier jet est gardé en mémoire
+
+# Dés classiques partagés entre les lancers, indexés par nombre de faces
+_CLASSIC_CACHE : dict[int, 'ClassicDice'] = {}
+_CLASSIC_CACHE_SIZE = 256
+
+# Jets sauvegardés déjà analysés, partagés entre les serveurs et indexés par leur texte en base
+_PARSE_CACHE : OrderedDict[str, 'DiceThrow'] = OrderedDict()
+_PARSE_CACHE_SIZE = 512
+_PARSE_CACHE_ADMISSION = 0.3 # Part des jets analysés admis dans le cache (les jets fréquents finissent par y entrer)
+_parse_cache_credit = 0.0
+
+# UTILS =======================================================================
+
+def _parse_dice(token: str) -> tuple[int, int | list[int]]:
+    """Analyse un dé au format NdF (dé classique) ou Nd(F1,F2,FN...) (dé personnalisé, un espace toléré après chaque virgule)
+    
+    :return: Nombre de dés et nombre de faces (dé classique) ou liste des faces (dé personnalisé)
+    :raises ValueError: Si le format est invalide"""
+    n, sep, f = token.partition('d')
+    if not sep or (n and not n.isdecimal()):
+        raise ValueError(f'Format de dé invalide : {token}')
+    count = int(n) if n else 1
+    
+    if f.isdecimal():
+        return count, int(f)
+    if len(f) < 3 or f[0] != '(' or f[-1] != ')':
+        raise ValueError(f'Format de dé invalide : {token}')
+    faces = []
+    for i, part in enumerate(f[1:-1].split(',')):
+        if i and part[:1].isspace():
+            part = part[1:]
+        if not part.isdecimal():
+            raise ValueError(f'Format de dé invalide : {token}')
+        faces.append(int(part))
+    return count, faces
+
+def _roll_indexes(bounds: tuple[int, ...]) -> list[int]:
+    """Tire un indice dans [0, b[ pour chaque borne b à partir d'un seul mot aléatoire de 64 bits, par multiplication et décalage (méthode de Lemire)"""
+    x = random.getrandbits(64)
+    indexes = []
+    for b in bounds:
+        m = x * b
+        indexes.append(m >> 64)
+        x = m & _MASK64
+    return indexes
+
+def _get_classic(faces: int) -> 'ClassicDice':
+    """Renvoie le dé classique à N faces, partagé entre tous les lancers"""
+    dice = _CLASSIC_CACHE.get(faces)
+    if dice is None:
+        dice = ClassicDice(faces)
+        if len(_CLASSIC_CACHE) < _CLASSIC_CACHE_SIZE:
+            _CLASSIC_CACHE[faces] = dice
+    return dice
+
 # CLASSES =====================================================================
 
 class Dice:
     """Représente un dé à plusieurs faces."""
     def __init__(self, faces: list[int]):
         self.faces = faces
+        self._init_key(faces)
+        self._str = f"d({','.join(map(str, faces))})"
+        
+    def _init_key(self, faces: list[int] | range):
+        """Calcule la clé d'égalité et le hash du dé (partagés par les dés classiques et personnalisés)"""
+        # Des faces 1 à N sont représentées par un range pour qu'un dé personnalisé égale le dé classique équivalent
+        if isinstance(faces, range):
+            key = faces
+        else:
+            key = tuple(faces)
+            if key == tuple(range(1, len(key) + 1)):
+                key = range(1, len(key) + 1)
+        # Les faces ne changent pas après la création : le hash est calculé une seule fois
+        self._key = key
+        self._hash = hash(key)
         
     def __repr__(self):
         return f'<Dice faces={self.faces}>'
     
     def __str__(self):
-        return f"d({','.join([str(f) for f in self.faces])})"
+        return self._str
     
     def __eq__(self, __value: object) -> bool:
-        return isinstance(__value, Dice) and self.faces == __value.faces
+        return isinstance(__value, Dice) and self._key == __value._key
     
     def __hash__(self) -> int:
-        return hash(tuple(self.faces))
+        return self._hash
     
     # SERIALIZATION -----------------------------------------------------------
     
@@ -50,32 +134,36 @@ class Dice:
 class ClassicDice(Dice):
     """Représente un dé classique à N faces."""
     def __init__(self, faces: int):
-        super().__init__(list(range(1, faces + 1)))
+        # Les faces sont un range (indexable et hashable) : rien n'est matérialisé, quel que soit le nombre de faces
+        self.faces = range(1, faces + 1)
+        self._faces_count = faces
+        self._init_key(self.faces)
+        self._str = f"d{faces}"
         
     def __repr__(self):
-        return f'<ClassicDice faces={len(self.faces)}>'
+        return f'<ClassicDice faces={self._faces_count}>'
     
-    def __str__(self):
-        return f"d{len(self.faces)}"
+    def roll(self) -> int:
+        """Lance le dé."""
+        return random.randint(1, self._faces_count)
     
 class DiceThrow:
     """Représente un jet de plusieurs dés."""
     def __init__(self, dices: list[Dice]):
         self.dices = dices
+        # Faces, nombres de faces et libellés de chaque dé, précalculés pour les lancers
+        self._faces_tables = tuple(d.faces if isinstance(d.faces, range) else tuple(d.faces) for d in dices)
+        self._counts = tuple(len(f) for f in self._faces_tables)
+        self._total = math.prod(self._counts)
+        self._labels = tuple(d._str for d in dices)
         
     def __repr__(self):
         return f'<DiceThrow dices={self.dices}>'
     
     def __str__(self):
         # On compte les dés identiques et on les affiche sous la forme NdF
-        dices = {}
-        for d in self.dices:
-            if d in dices:
-                dices[d] += 1
-            else:
-                dices[d] = 1
-             
-        return ' + '.join([f"{dices[d] if dices[d] > 1 else ''}{str(d)}" for d in dices])
+        counts = Counter(self.dices)
+        return ' + '.join(f"{n if n > 1 else ''}{d}" for d, n in counts.items())
     
     # SERIALIZATION -----------------------------------------------------------
     
@@ -84,15 +172,44 @@ class DiceThrow:
     
     @classmethod
     def _from_string(cls, string: str):
-        return cls([Dice._from_string(d) for d in string.split(',')])
+        global _parse_cache_credit
+        throw = _PARSE_CACHE.get(string)
+        if throw is not None:
+            _PARSE_CACHE.move_to_end(string)
+            return throw
+        
+        throw = cls([Dice._from_string(d) for d in string.split(',')])
+        # Admission d'un jet sur ~3 : le cache retient les jets populaires sans se remplir de jets isolés
+        _parse_cache_credit += _PARSE_CACHE_ADMISSION
+        if _parse_cache_credit >= 1:
+            _parse_cache_credit -= 1
+            _PARSE_CACHE[string] = throw
+            if len(_PARSE_CACHE) > _PARSE_CACHE_SIZE:
+                _PARSE_CACHE.popitem(last=False)
+        return throw
     
     # ROLLING -----------------------------------------------------------------
     
     def roll_sum(self) -> int:
-        return sum([d.roll() for d in self.dices])
+        return sum(self.roll_all())
     
     def roll_all(self) -> list[int]:
-        return [d.roll() for d in self.dices]
+        randrange = random.randrange
+        return [f[randrange(c)] for f, c in zip(self._faces_tables, self._counts)]
+    
+    def roll_all_batched(self) -> list[int]:
+        """Lance tous les dés en un seul tirage aléatoire, décomposé ensuite dé par dé"""
+        total = self._total
+        if not total or total > _BATCH_ROLL_LIMIT:
+            return self.roll_all()
+        if total <= _LEMIRE_ROLL_LIMIT:
+            return [f[i] for f, i in zip(self._faces_tables, _roll_indexes(self._counts))]
+        r = random.randrange(total)
+        results = []
+        for f, c in zip(self._faces_tables, self._counts):
+            r, i = divmod(r, c)
+            results.append(f[i])
+        return results
     
 class ThrowTransformer(app_commands.Transformer):
     """Convertit une chaîne en un jet de dés."""
@@ -101,29 +218,23 @@ class ThrowTransformer(app_commands.Transformer):
         dices = []
         string = [v.strip() for v in value.split('+')]
         for dice in string:
+            try:
+                n, f = _parse_dice(dice)
+            except ValueError:
+                await interaction.response.send_message(f"**Invalide** · Les dés doivent être au format NdF ou Nd(F1,F2,FN...) et séparés par des '+'")
+                raise commands.BadArgument('Format de lancer de dés invalide')
+            
+            # Le nombre de dés est vérifié avant de créer la liste, N pouvant être arbitrairement grand
+            if len(dices) + n > 20:
+                await interaction.response.send_message(f"**Trop de dés** · Vous ne pouvez pas lancer plus de 20 dés à la fois")
+                raise commands.BadArgument('Nombre de dés trop important')
+            
             # Les dés classiques sont sous la forme NdF 
-            if re.match(r'^(\d+)?d\d+$', dice):
-                n, f = dice.split('d')
-                if not n:
-                    n = 1
-                for _ in range(int(n)):
-                    dices.append(ClassicDice(int(f)))
+            if isinstance(f, int):
+                dices.extend([_get_classic(f)] * n)
             # Les dés personnalisés sont sous la forme Nd(F1,F2,FN...)
-            elif re.match(r'^(\d+)?d\(\d+(,\s?\d+)*\)$', dice):
-                n, f = dice.split('d')
-                if not n:
-                    n = 1
-                faces = f[1:-1].split(',')
-                faces = [int(f.strip()) for f in f[1:-1].split(',')]
-                for _ in range(int(n)):
-                    dices.append(Dice(faces))
             else:
-                await interaction.response.send_message(f"**Invalide** · Les dés doivent être au format NdF ou Nd(F1,F2,FN...) et séparés par des '+'")
-                raise commands.BadArgument('Format de lancer de dés invalide')
-        
-        if len(dices) > 20:
-            await interaction.response.send_message(f"**Trop de dés** · Vous ne pouvez pas lancer plus de 20 dés à la fois")
-            raise commands.BadArgument('Nombre de dés trop important')
+                dices.extend([Dice(f)] * n)
             
         return DiceThrow(dices)
         
@@ -134,7 +245,10 @@ class GameTools(commands.Cog):
         self.bot = bot
         self.data = dataio.get_cog_data(self)
         
-        self.throws : dict[int, DiceThrow] = {}
+        # Dernier jet de chaque membre, les moins récents étant oubliés au-delà de LAST_THROWS_SIZE
+        self.throws : OrderedDict[int, DiceThrow] = OrderedDict()
+        # Cache LRU des jets sauvegardés, indexés par (ID du serveur, nom)
+        self._throw_cache : OrderedDict[tuple[int, str], dict | None] = OrderedDict()
         
     def _init_guilds_db(self, guild: discord.Guild | None = None):
         guilds = [guild] if guild else list(self.bot.guilds)
@@ -160,33 +274,42 @@ class GameTools(commands.Cog):
     
     def load_throw(self, guild: discord.Guild, name: str) -> dict | None:
         """Charge un jet de dés sauvegardé."""
-        query = """SELECT * FROM throws WHERE name = ?"""
-        data = self.data.fetchone(guild, query, (name,))
-        if data:
-            return {
-                'name': data[0],
-                'throw': DiceThrow._from_string(data[1])
-            }
-        return None
+        key = (guild.id, name)
+        if key in self._throw_cache:
+            self._throw_cache.move_to_end(key)
+            return self._throw_cache[key]
+        
+        data = self.data.fetchone(guild, _SQL_LOAD_THROW, (name,))
+        throw = {'name': name, 'throw': DiceThrow._from_string(data[0])} if data else None
+        self._throw_cache[key] = throw
+        if len(self._throw_cache) > THROW_CACHE_SIZE:
+            self._throw_cache.popitem(last=False)
+        return throw
     
     def save_throw(self, guild: discord.Guild, name: str, throw: DiceThrow):
         """Sauvegarde un jet de dés"""
-        query = """INSERT OR REPLACE INTO throws VALUES (?, ?)"""
-        self.data.execute(guild, query, (name, throw._to_string()))
+        self.data.execute(guild, _SQL_SAVE_THROW, (name, throw._to_string()))
+        self._throw_cache.pop((guild.id, name), None)
         
     def delete_throw(self, guild: discord.Guild, name: str):
         """Efface un jet de dés sauvegardé."""
-        query = """DELETE FROM throws WHERE name = ?"""
-        self.data.execute(guild, query, (name,))
-        
-    def get_throws(self, guild: discord.Guild) -> list[dict]:
-        """Liste les jets de dés sauvegardés."""
-        query = """SELECT * FROM throws"""
-        data = self.data.fetchall(guild, query)
-        return [{
-            'name': d[0],
-            'dices': DiceThrow._from_string(d[1])
-        } for d in data]
+        self.data.execute(guild, _SQL_DELETE_THROW, (name,))
+        self._throw_cache.pop((guild.id, name), None)
+        
+    def get_throws(self, guild: discord.Guild) -> Iterator[dict]:
+        """Parcourt les jets de dés sauvegardés."""
+        for row in self.data.fetchiter(guild, _SQL_LIST_THROWS):
+            yield {
+                'name': row[0],
+                'dices': DiceThrow._from_string(row[1])
+            }
+        
+    def _remember(self, user_id: int, throw: DiceThrow):
+        """Retient le dernier jet de dés d'un membre."""
+        self.throws[user_id] = throw
+        self.throws.move_to_end(user_id)
+        if len(self.throws) > LAST_THROWS_SIZE:
+            self.throws.popitem(last=False)
         
     # COMMANDS =================================================================
     
@@ -203,13 +326,14 @@ class GameTools(commands.Cog):
 
         :param dices: Dés à lancer (format NdF ou Nd(F1,F2,FN...))
         """
-        rolls = []
-        for d in dices.dices:
-            rolls.append((str(d), d.roll()))
-        text = pretty.codeblock(tabulate(rolls, tablefmt='plain'))
+        rolls = list(zip(dices._labels, dices.roll_all_batched()))
+        # Deux colonnes fixes (dé, résultat) : alignement manuel plutôt que tabulate
+        width = max((len(label) for label, _ in rolls), default=0)
+        value_width = max((len(str(value)) for _, value in rolls), default=0)
+        text = pretty.codeblock('\n'.join(f"{label:<{width}}  {value:>{value_width}}" for label, value in rolls))
         em = discord.Embed(description=f"# `🎲 {dices}`\n{text}")
         await interaction.response.send_message(embed=em)
-        self.throws[interaction.user.id] = dices
+        self._remember(interaction.user.id, dices)
         
     # TODO: Sauvegarde des dés
     
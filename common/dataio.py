@@ -1,9 +1,10 @@
 import sqlite3
 import discord
 import os
+from contextlib import contextmanager
 from discord.ext import commands
 from pathlib import Path
-from typing import Union, Dict, List, Optional, Callable
+from typing import Union, Dict, List, Optional, Callable, Iterable, Iterator
 
 OBJECT_PATH_STRUCTURE = {
         discord.User: "usr_{obj.id}",
@@ -14,16 +15,26 @@ OBJECT_PATH_STRUCTURE = {
         discord.VoiceChannel: "vch_{obj.id}"
     }
 
+# Nombre de requêtes préparées conservées par connexion (sqlite3 les réutilise lorsque le texte SQL est identique)
+SQLITE_CACHED_STATEMENTS = 256
+
 DB_TYPES = Union[discord.User, discord.Member, discord.Guild, discord.TextChannel, discord.Thread, discord.VoiceChannel, str, int]
 
 class CogData:
     """Représente l'ensemble des données d'un Cog"""
-    def __init__(self, cog_name: str) -> None:
+    def __init__(self, cog_name: str, pragmas: Iterable[str] = ()) -> None:
         self.cog_name = cog_name
         self.cog_folder = Path(f"cogs/{self.cog_name}")
+        # PRAGMA exécutés à l'ouverture de chaque connexion
+        self.pragmas = tuple(pragmas)
         
-        # Cache des connexions aux bases de données
+        # Cache des connexions aux bases de données (par objet, et par nom de fichier pour qu'un objet et son ID partagent la même connexion)
         self._db_cache = {}
+        self._db_by_name = {}
+        # Connexions ayant une transaction explicite en cours
+        self._transactions = set()
+        # Fonctions à exécuter après le COMMIT de la transaction en cours, par connexion
+        self._after_commit = {}
         
     def __repr__(self) -> str:
         return f"<CogData {self.cog_name}>"
@@ -51,27 +62,27 @@ class CogData:
         folder = self.cog_folder / "data"
         folder.mkdir(parents=True, exist_ok=True)
         db_path = folder / f"{_get_object_db_name(obj)}.db"
-        return sqlite3.connect(db_path)
+        return sqlite3.connect(db_path, cached_statements=SQLITE_CACHED_STATEMENTS)
     
     def _load_database(self, obj: DB_TYPES, enable_row_factory: bool = True) -> sqlite3.Connection:
         """Charge une base de données pour un objet discord ou en crée une si elle n'existe pas encore"""
         if obj in self._db_cache:
             return self._db_cache[obj]
-        conn = self._get_sqlite_conn(obj)
-        if enable_row_factory:
-            conn.row_factory = sqlite3.Row
+        name = _get_object_db_name(obj)
+        conn = self._db_by_name.get(name)
+        if conn is None:
+            conn = self._get_sqlite_conn(obj)
+            if enable_row_factory:
+                conn.row_factory = sqlite3.Row
+            for pragma in self.pragmas:
+                conn.execute(pragma)
+            self._db_by_name[name] = conn
         self._db_cache[obj] = conn
         return conn
     
     def _load_existing_databases(self, enable_row_factory: bool = True) -> Dict[str, sqlite3.Connection]:
         """Charge toutes les bases de données du Cog déjà existantes"""
-        dbs = {}
-        for db in self.cog_folder.glob("data/*.db"):
-            conn = sqlite3.connect(db)
-            if enable_row_factory:
-                conn.row_factory = sqlite3.Row
-            dbs[db.stem] = conn
-        return dbs
+        return {db.stem: self._load_database(db.stem, enable_row_factory) for db in self.cog_folder.glob("data/*.db")}
 
     def get_database(self, obj: DB_TYPES) -> sqlite3.Connection:
         """Retourne une base de données pour un objet discord
@@ -94,14 +105,71 @@ class CogData:
         :param obj: Objet discord (User, Member, Guild, TextChannel) ou ID de l'objet
         """
         if obj in self._db_cache:
-            self._db_cache[obj].close()
-            del self._db_cache[obj]
+            conn = self._db_cache[obj]
+            self._transactions.discard(conn)
+            self._after_commit.pop(conn, None)
+            conn.close()
+            self._db_cache = {k: c for k, c in self._db_cache.items() if c is not conn}
+            self._db_by_name = {k: c for k, c in self._db_by_name.items() if c is not conn}
             
     def close_all_databases(self) -> None:
         """Ferme toutes les connexions aux bases de données du Cog"""
-        for conn in self._db_cache.values():
+        for conn in self._db_by_name.values():
             conn.close()
         self._db_cache = {}
+        self._db_by_name = {}
+        self._transactions = set()
+        self._after_commit = {}
+        
+    # Transactions -------------------
+    
+    @contextmanager
+    def transaction(self, obj: DB_TYPES) -> Iterator[sqlite3.Connection]:
+        """Regroupe les requêtes exécutées dans le bloc en une seule transaction (BEGIN IMMEDIATE / COMMIT)
+        
+        Les commits demandés à l'intérieur du bloc sont différés jusqu'à sa sortie, et la transaction est annulée en cas d'erreur. Les blocs imbriqués sont fusionnés dans la transaction la plus externe.
+        Les fonctions enregistrées avec `call_after_commit` sont exécutées après le COMMIT, ou abandonnées si la transaction est annulée.
+
+        :param obj: Objet discord (User, Member, Guild, TextChannel) ou ID de l'objet
+        :return: Connexion à la base de données du Cog
+        """
+        conn = self.get_database(obj)
+        if conn in self._transactions:
+            yield conn
+            return
+        
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        self._transactions.add(conn)
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            self._transactions.discard(conn)
+            callbacks = self._after_commit.pop(conn, ())
+        for callback in callbacks:
+            callback()
+            
+    def call_after_commit(self, obj: DB_TYPES, callback: Callable[[], None]) -> None:
+        """Exécute une fonction après le COMMIT de la transaction en cours sur la base de données (immédiatement si aucune transaction n'est ouverte)
+
+        :param obj: Objet discord (User, Member, Guild, TextChannel) ou ID de l'objet
+        :param callback: Fonction à exécuter, abandonnée si la transaction est annulée
+        """
+        conn = self.get_database(obj)
+        if conn in self._transactions:
+            self._after_commit.setdefault(conn, []).append(callback)
+        else:
+            callback()
+            
+    def _commit(self, conn: sqlite3.Connection) -> None:
+        if conn not in self._transactions:
+            conn.commit()
         
     # Operations ---------------------
 
@@ -134,21 +202,40 @@ class CogData:
         result = cursor.fetchall()
         cursor.close()
         return result
+    
+    def fetchiter(self, obj: DB_TYPES, query: str, *args) -> Iterator[sqlite3.Row]:
+        """Exécute une requête SQL de recherche et parcourt les lignes du résultat au fur et à mesure, sans les charger toutes en mémoire
+
+        :param obj: Objet discord (User, Member, Guild, TextChannel) ou ID de l'objet
+        :param query: Requête SQL à exécuter
+        :param *args: Arguments de la requête SQL
+        :return: Itérateur sur les lignes du résultat
+        """
+        conn = self.get_database(obj)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, *args)
+            yield from cursor
+        finally:
+            cursor.close()
         
-    def execute(self, obj: DB_TYPES, query: str, *args, commit: bool = True) -> None:
+    def execute(self, obj: DB_TYPES, query: str, *args, commit: bool = True) -> int:
         """Exécute une requête SQL d'édition
 
         :param obj: Objet discord (User, Member, Guild, TextChannel) ou ID de l'objet
         :param query: Requête SQL à exécuter
         :param *args: Arguments de la requête SQL
         :param commit: Si True, commit les changements sur la base de données immédiatement (True par défaut)
+        :return: Nombre de lignes modifiées par la requête
         """
         conn = self.get_database(obj)
         cursor = conn.cursor()
         cursor.execute(query, *args)
         if commit:
-            conn.commit()
+            self._commit(conn)
+        rowcount = cursor.rowcount
         cursor.close()
+        return rowcount
         
     def executemany(self, obj: DB_TYPES, query: str, *args, commit: bool = True) -> None:
         """Exécute une requête SQL pour plusieurs lignes
@@ -162,7 +249,7 @@ class CogData:
         cursor = conn.cursor()
         cursor.executemany(query, *args)
         if commit:
-            conn.commit()
+            self._commit(conn)
         cursor.close()
         
     def commit(self, obj: DB_TYPES) -> None:
@@ -171,7 +258,7 @@ class CogData:
         :param obj: Objet discord (User, Member, Guild, TextChannel) ou ID de l'objet
         """
         conn = self.get_database(obj)
-        conn.commit()
+        self._commit(conn)
         
     # Utils --------------------------
     
@@ -233,14 +320,15 @@ class UserDataEntry:
         return cls(**data)
 
         
-def get_cog_data(cog: Union[commands.Cog, str]) -> CogData:
+def get_cog_data(cog: Union[commands.Cog, str], *, pragmas: Iterable[str] = ()) -> CogData:
     """Retourne les données d'un Cog
 
     :param cog: Cog ou nom du Cog
+    :param pragmas: PRAGMA SQLite à exécuter à l'ouverture de chaque connexion, par défaut aucun
     :return: Données du Cog
     """
     name = cog if isinstance(cog, str) else cog.qualified_name
-    return CogData(name.lower())
+    return CogData(name.lower(), pragmas)
 
 # Fonctions utilitaires -----------------------
         
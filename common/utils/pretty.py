@@ -2,6 +2,10 @@
 from typing import Union
 from datetime import datetime, timedelta
 
+_SPACE_SEPARATOR_TABLE = str.maketrans({',': ' '}) # Séparateur de milliers par défaut
+_TIME_UNITS = (('jour', 'jours'), ('heure', 'heures'), ('minute', 'minutes'), ('seconde', 'secondes')) # Unités de parse_time (singulier, pluriel)
+_BAR_CHART_10 = tuple('█' * (i // 2) + ('▌' if i % 2 else '') for i in range(21)) # Diagrammes de 10 caractères, par demi-barre
+
 def bar_chart(value: int | float, total: int | float, *, lenght: int = 10, use_half_bar: bool = True, display_percent: bool = False) -> str:
     """Retourne un diagramme en barres
 
@@ -16,12 +20,11 @@ def bar_chart(value: int | float, total: int | float, *, lenght: int = 10, use_h
         return ' '
     percent = (value / total) * 100
     nb_bars = percent / (100 / lenght)
-    bars = '█' * int(nb_bars)
-    if (nb_bars % 1) >= 0.5 and use_half_bar:
-        bars += '▌'
-    if display_percent:
-        bars += f' {round(percent)}%'
-    return bars
+    if lenght == 10 and use_half_bar and not display_percent and 0 <= nb_bars <= 10:
+        return _BAR_CHART_10[int(nb_bars * 2)]
+    half_bar = '▌' if use_half_bar and (nb_bars % 1) >= 0.5 else ''
+    percent_text = f' {round(percent)}%' if display_percent else ''
+    return f"{'█' * int(nb_bars)}{half_bar}{percent_text}"
 
 def troncate_text(text: str, length: int, add_ellipsis: bool = True) -> str:
     """Retourne une version tronquée du texte donné
@@ -32,9 +35,9 @@ def troncate_text(text: str, length: int, add_ellipsis: bool = True) -> str:
     """
     if len(text) <= length:
         return text
-    if add_ellipsis:
-        length -= 1
-    return text[:length] + '…' if add_ellipsis else ''
+    if not add_ellipsis:
+        return text[:length]
+    return text[:length - 1] + '…'
     
 def humanize_number(number: Union[int, float], separator: str = ' ') -> str:
     """Formatte un nombre pour qu'il soit plus lisible
@@ -43,7 +46,9 @@ def humanize_number(number: Union[int, float], separator: str = ' ') -> str:
     :param separator: Séparateur entre groupes de 3 chiffres, par défaut ' '
     :return: str
     """
-    return f'{number:,}'.replace(',', separator)
+    if separator == ' ':
+        return format(number, ',').translate(_SPACE_SEPARATOR_TABLE)
+    return format(number, ',').replace(',', separator)
 
 def codeblock(text: str, lang: str = "") -> str:
     """Retourne le texte sous forme d'un bloc de code
@@ -56,22 +61,6 @@ def codeblock(text: str, lang: str = "") -> str:
 
 def parse_time(delta: timedelta) -> str:
     """Renvoie un texte représentant la durée relative donnée"""
-    seconds = delta.seconds + delta.days * 24 * 3600
-    units = {
-        'j': delta.days,
-        'h': seconds // 3600 % 24,
-        'm': seconds // 60 % 60,
-        's': seconds % 60
-    }
-    trsl = {
-        'j': ('jour', 'jours'),
-        'h': ('heure', 'heures'),
-        'm': ('minute', 'minutes'),
-        's': ('seconde', 'secondes')
-    }
-    txt = ""
-    for unit, value in units.items():
-        if value > 0:
-            txt += f"{value} {trsl[unit][0] if value == 1 else trsl[unit][1]} "
-    
-    return txt.strip()
+    seconds = delta.seconds
+    values = (delta.days, seconds // 3600, seconds // 60 % 60, seconds % 60)
+    return ' '.join(f"{value} {single if value == 1 else plural}" for value, (single, plural) in zip(values, _TIME_UNITS) if value > 0)